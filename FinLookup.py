@@ -5,20 +5,88 @@ from datetime import date, timedelta
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 import dash_bootstrap_components as dbc
-from utils import get_stock_dict
-from controller import Controller, open_collapse
+import utils
+from company_index import get_company_index
+from controller import Controller, open_collapse, compact_figure, data_cache, update_screener
+from metrics import instrument_app, register_cache
+from query import WIDENING
+from screener import add_screener_api, SCREEN_COLUMNS
 
 DATA_DIR = './Data/'
 API_TOKEN = ""
 FONT_DIR = './Font/SourceHanSansTW-Regular.otf'
-
-tw_dict, eng_dict = get_stock_dict()
+NLP_WARM_UP = False
+# Point budget of the line traces, e.g. 500 draws the price as a downsampled close line
+MAX_POINTS = None
+# Send each company's whole history once and apply the selected date range in the browser
+CLIENT_RANGE = False
+# Time every callback and Controller method and serve the results on /metrics
+METRICS = True
+# FinMind requests: 'live', 'record' (also saved under RECORD_DIR) or 'replay' (offline from RECORD_DIR)
+FETCH_MODE = 'live'
+RECORD_DIR = DATA_DIR + 'FinMind_Records/'
+
+# Graphs whose figures follow the Time-Slider, with the dataset that sets their range widening
+RANGE_GRAPHS = {
+    'Price-Graph': None,
+    'Revenue-Graph': 'Revenue',
+    'Financial-Statements-Graph': 'Statements',
+    'Shareholding-Graph': 'Shareholding',
+    'Investors-Graph': None,
+}
+
+company_index = get_company_index()
+tw_dict, eng_dict = company_index.get_dicts()
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 server = app.server
 
+utils.FETCH_MODE = FETCH_MODE
+utils.RECORD_DIR = RECORD_DIR
+
+# Companies ranked from Data/Market_Panel.csv, built by `python screener.py`
+add_screener_api(server, DATA_DIR)
+
+if NLP_WARM_UP:
+    # Otherwise the NLP stack is only imported by the first NLP Analysis
+    from model_service import get_model_service
+    get_model_service().warm_up(('ner',))
+
+
+def get_controller(company_id):
+    # Controllers are built per callback from its inputs; loaded data is shared through the process-wide cache
+    return Controller(DATA_DIR, FONT_DIR, company_id, max_points=MAX_POINTS)
+
+
+def range_inputs():
+    if CLIENT_RANGE:
+        return []
+    return [Input("Time-Slider", "start_date"), Input("Time-Slider", "end_date")]
+
+
+def figure_output(graph_id):
+    # With CLIENT_RANGE the whole-history figure goes to a store and the browser draws the range
+    if CLIENT_RANGE:
+        return Output(graph_id + '-History', 'data')
+    return Output(graph_id, 'figure')
+
+
+def get_date_range(inputs):
+    # The whole history is a range of (None, None)
+    return (None, None) if CLIENT_RANGE else tuple(inputs)
+
+
+def get_figure_result(result):
+    # The figure leads the outputs; with CLIENT_RANGE it is the history sent once per company
+    if not CLIENT_RANGE:
+        return result
+    if isinstance(result, tuple):
+        return (compact_figure(result[0]),) + result[1:]
+    return compact_figure(result)
+
+
 # Get Data
 
 @app.callback(
@@ -31,9 +99,16 @@ server = app.server
     [Input("Data-Mode", "value"), Input("Dropdown-Company", "value")]
 )
 def get_data(online_mode, company_id):
-    global controller
-    controller = Controller(DATA_DIR, FONT_DIR, company_id)
-    return controller.get_data(eng_dict, API_TOKEN, online_mode)
+    return get_controller(company_id).get_data(eng_dict, API_TOKEN, bool(online_mode), full_sync=online_mode == 'full')
+
+
+@app.callback(
+    Output('Dropdown-Company', 'options'),
+    [Input('Dropdown-Company', 'search_value')],
+    [State('Dropdown-Company', 'value')]
+)
+def search_company(search_value, company_id):
+    return company_index.get_options(company_index.search(search_value), company_id)
 
 
 @app.callback(
@@ -41,54 +116,49 @@ def get_data(online_mode, company_id):
     [Input('Company-ID', 'data')]
 )
 def update_news(company_id):
-    controller.reset(company_id)
-    return controller.update_news()
+    return get_controller(company_id).update_news()
 
 
 # Plot Price, Volume, Buy-Sell
 
 @app.callback(
-    Output('Price-Graph', 'figure'),
-    Output('Header-TimeRange', 'children'),
+    figure_output('Price-Graph'),
+    # With CLIENT_RANGE the browser writes the range header
+    *([] if CLIENT_RANGE else [Output('Header-TimeRange', 'children')]),
     Output('Latest-Price', 'children'),
     Output('Latest-Updown', 'children'),
     Output('Latest-Price', 'style'),
     Output('Latest-Updown', 'style'),
     Output('Latest-Date', 'children'),
-    [Input("Time-Slider", "start_date"),
-     Input("Time-Slider", "end_date"),
-     Input('Company-ID', 'data')]
+    range_inputs() + [Input('Company-ID', 'data')]
 )
-def update_price_figure(start_date, end_date, company_id):
-    controller.reset(company_id)
-    return controller.update_price_figure(start_date, end_date)
+def update_price_figure(*inputs):
+    result = get_figure_result(get_controller(inputs[-1]).update_price_figure(*get_date_range(inputs[:-1])))
+    return result[:1] + result[2:] if CLIENT_RANGE else result
 
 
 # Plot Revenue YoY/MoM
 @app.callback(
-    Output('Revenue-Graph', 'figure'),
+    figure_output('Revenue-Graph'),
     Output('Revenue-Table', 'children'),
     Output('YoY-Label', 'children'),
     Output('MoM-Label', 'children'),
-    [Input("Time-Slider", "start_date"),
-     Input("Time-Slider", "end_date"), Input('Company-ID', 'data')]
+    range_inputs() + [Input('Company-ID', 'data')]
 )
-def update_revenue_figure(start_date, end_date, company_id):
-    controller.reset(company_id)
-    return controller.update_revenue_figure(start_date, end_date)
+def update_revenue_figure(*inputs):
+    return get_figure_result(get_controller(inputs[-1]).update_revenue_figure(*get_date_range(inputs[:-1])))
 
 
 @app.callback(
-    Output('Financial-Statements-Graph', 'figure'),
+    figure_output('Financial-Statements-Graph'),
     Output('Financial-Statements-Table', 'children'),
     Output('EPS-Label', 'children'),
     Output('Gross-Margin-Label', 'children'),
-    [Input("Time-Slider", "start_date"), Input("Time-Slider", "end_date"),
-     Input('Company-ID', 'data')]
+    range_inputs() + [Input('Company-ID', 'data')]
 )
-def update_financial_statements_figure(start_date, end_date, company_id):
-    controller.reset(company_id)
-    return controller.update_financial_statements_figure(start_date, end_date)
+def update_financial_statements_figure(*inputs):
+    controller = get_controller(inputs[-1])
+    return get_figure_result(controller.update_financial_statements_figure(*get_date_range(inputs[:-1])))
 
 
 @app.callback(
@@ -97,18 +167,51 @@ def update_financial_statements_figure(start_date, end_date, company_id):
     [Input('Company-ID', 'data')]
 )
 def update_per_ratio(company_id):
-    controller.reset(company_id)
-    return controller.update_per_ratio()
+    return get_controller(company_id).update_per_ratio()
 
 
 @app.callback(
-    Output('Shareholding-Graph', 'figure'),
-    [Input("Time-Slider", "start_date"), Input("Time-Slider", "end_date"),
-     Input('Company-ID', 'data')]
+    figure_output('Shareholding-Graph'),
+    range_inputs() + [Input('Company-ID', 'data')]
 )
-def update_shareholding(start_date, end_date, company_id):
-    controller.reset(company_id)
-    return controller.update_shareholding(start_date, end_date)
+def update_shareholding(*inputs):
+    return get_figure_result(get_controller(inputs[-1]).update_shareholding(*get_date_range(inputs[:-1])))
+
+
+@app.callback(
+    figure_output('Investors-Graph'),
+    range_inputs() + [Input('Company-ID', 'data')]
+)
+def update_investors_figure(*inputs):
+    return get_figure_result(get_controller(inputs[-1]).update_investors_figure(*get_date_range(inputs[:-1])))
+
+
+@app.callback(
+    Output('Screener-Table', 'children'),
+    Output('Screener-Count', 'children'),
+    [Input('Screener-Filter', 'value'), Input('Screener-Sort', 'value'), Input('Screener-Order', 'value')]
+)
+def update_screener_table(text, sort_by, order):
+    return update_screener(DATA_DIR, text, sort_by, order == 'asc', company_index)
+
+
+if CLIENT_RANGE:
+    for graph_id, name in RANGE_GRAPHS.items():
+        min_days, years = WIDENING.get(name, (0, 0))
+        app.clientside_callback(
+            "function(history, start, end) {"
+            " return window.dash_clientside.fin_lookup.set_range(history, start, end, " +
+            str(min_days) + ", " + str(years) + "); }",
+            Output(graph_id, 'figure'),
+            [Input(graph_id + '-History', 'data'), Input("Time-Slider", "start_date"),
+             Input("Time-Slider", "end_date")]
+        )
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='fin_lookup', function_name='time_range'),
+        Output('Header-TimeRange', 'children'),
+        [Input("Time-Slider", "start_date"), Input("Time-Slider", "end_date")]
+    )
 
 
 @app.callback(
@@ -116,8 +219,7 @@ def update_shareholding(start_date, end_date, company_id):
     [Input("NLP-Button", "n_clicks"), Input('Company-ID', 'data')]
 )
 def update_nlp_news(n, company_id):
-    controller.reset(company_id)
-    return controller.update_nlp_news(n)
+    return get_controller(company_id).update_nlp_news(n)
 
 
 @app.callback(
@@ -147,6 +249,10 @@ def toggle_collapse(n, is_open):
     return open_collapse(n, is_open)
 
 
+if METRICS:
+    register_cache('data', data_cache)
+    instrument_app(app)
+
 ######################################################################################
 # View
 ######################################################################################
@@ -288,6 +394,29 @@ graph_view = html.Div([
                         html.Br(),
                     ], label='Shareholding'),
 
+                    dbc.Tab([
+                        dbc.Spinner(color="primary",
+                                    children=[dcc.Graph(id='Investors-Graph')]),
+                        html.Br(),
+                    ], label='Investors'),
+
+                    dbc.Tab([
+                        html.Br(),
+                        dbc.Row([
+                            dbc.Col(dbc.Input(id='Screener-Filter', placeholder='PER<15 YoY>20', debounce=True),
+                                    width=5),
+                            dbc.Col(dcc.Dropdown(id='Screener-Sort', value='dividend_yield', clearable=False,
+                                                 options=[{'label': column, 'value': column}
+                                                          for column in ['stock_id'] + SCREEN_COLUMNS]), width=4),
+                            dbc.Col(dbc.RadioItems(id='Screener-Order', value='desc', inline=True,
+                                                   options=[{'label': 'Desc', 'value': 'desc'},
+                                                            {'label': 'Asc', 'value': 'asc'}]), width=3),
+                        ], className="mb-2"),
+                        html.Div(id='Screener-Count'),
+                        dbc.Card(dbc.Table(id='Screener-Table', style={'textAlign': 'right'}), body=False, style={
+                            'height': 500, 'overflowY': 'auto'}),
+                    ], label='Screener'),
+
                     dbc.Tab([
                         html.Br(),
                         dbc.ButtonGroup(
@@ -322,7 +451,7 @@ graph_view = html.Div([
 # Controller
 ######################################################################################
 
-controller = dbc.Card([
+control_view = dbc.Card([
     dbc.Row([
         dbc.Col(
             dbc.FormGroup([
@@ -330,7 +459,8 @@ controller = dbc.Card([
                 dbc.RadioItems(
                     id='Data-Mode',
                     options=[{'label': 'Online', 'value': True},
-                             {'label': 'Offline', 'value': False}],
+                             {'label': 'Offline', 'value': False},
+                             {'label': 'Resync', 'value': 'full'}],
                     value=False,
                     inline=True)
             ]), width={"size": 1, "offset": 1}),
@@ -340,8 +470,7 @@ controller = dbc.Card([
                 dbc.Label("Company"),
                 dcc.Dropdown(
                     id='Dropdown-Company',
-                    options=[
-                        {'label': str(item) + ' ' + tw_dict[item], 'value': item} for item in tw_dict],
+                    options=company_index.get_options([], 2330),
                     value=2330,
                     clearable=False)
             ]), width={"size": 2, "offset": 1}),
@@ -371,10 +500,11 @@ controller = dbc.Card([
 app.layout = dbc.Container([
 
     dcc.Store(id='Company-ID'),
+    *[dcc.Store(id=graph_id + '-History') for graph_id in RANGE_GRAPHS],
 
     header_view,
     html.Hr(),
-    controller,
+    control_view,
     html.Br(),
     info_view,
     graph_view,
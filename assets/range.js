@@ -0,0 +1,93 @@
+// Applies the Time-Slider range in the browser to figures that hold a company's whole
+// history (CLIENT_RANGE in FinLookup.py): the x axes are limited to the range, cumulative
+// traces are rebased to the range start and every y axis is fitted to the points inside
+// it, so the server is not called on a range change.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    fin_lookup: {
+        set_range: function (history, start, end, minDays, years) {
+            if (!history || !start || !end) {
+                return window.dash_clientside.no_update;
+            }
+            start = start.slice(0, 10);
+            end = end.slice(0, 10);
+            // Same widening of short ranges as query.get_date_range
+            if (minDays && (Date.parse(end) - Date.parse(start)) / 86400000 <= minDays) {
+                start = (parseInt(end.slice(0, 4), 10) - years) + '-01-01';
+            }
+
+            // Cumulative sums of the whole history restart from zero on the first day of the range
+            var data = history.data.map(function (trace) {
+                if (trace.meta !== 'cumulative' || !trace.y) {
+                    return trace;
+                }
+                var offset = 0;
+                (trace.x || []).forEach(function (x, i) {
+                    if (String(x).slice(0, 10) < start && trace.y[i] != null) {
+                        offset = trace.y[i];
+                    }
+                });
+                return Object.assign({}, trace, {
+                    y: trace.y.map(function (y) {
+                        return y == null ? y : y - offset;
+                    })
+                });
+            });
+
+            var extents = {};
+            data.forEach(function (trace) {
+                var axis = 'yaxis' + (trace.yaxis || 'y').slice(1);
+                var low = trace.low || trace.y || [];
+                var high = trace.high || trace.y || [];
+                var extent = extents[axis] || (extents[axis] = [Infinity, -Infinity]);
+                if (trace.type === 'bar') {
+                    extent[0] = Math.min(extent[0], 0);
+                    extent[1] = Math.max(extent[1], 0);
+                }
+                (trace.x || []).forEach(function (x, i) {
+                    var day = String(x).slice(0, 10);
+                    if (day < start || day > end || low[i] == null || high[i] == null) {
+                        return;
+                    }
+                    var bottom = low[i];
+                    var top = high[i];
+                    if (trace.base != null) {
+                        // Stacked bars run from their base to base + y
+                        var base = Array.isArray(trace.base) ? trace.base[i] || 0 : trace.base;
+                        bottom = Math.min(base, base + low[i]);
+                        top = Math.max(base, base + high[i]);
+                    }
+                    extent[0] = Math.min(extent[0], bottom);
+                    extent[1] = Math.max(extent[1], top);
+                });
+            });
+
+            var layout = Object.assign({}, history.layout);
+            Object.keys(layout).forEach(function (key) {
+                if (key.indexOf('xaxis') === 0) {
+                    layout[key] = Object.assign({}, layout[key], {range: [start, end], autorange: false});
+                }
+            });
+            Object.keys(extents).forEach(function (axis) {
+                var extent = extents[axis];
+                var range = (layout[axis] || {}).range;
+                if (!isFinite(extent[0]) || !isFinite(extent[1])) {
+                    return;
+                }
+                if (range && range[0] === -range[1]) {
+                    // Axes centred on zero by the server stay centred
+                    var limit = Math.max(Math.abs(extent[0]), Math.abs(extent[1])) * 1.1;
+                    range = [-limit, limit];
+                } else {
+                    var pad = (extent[1] - extent[0]) * 0.05 || Math.abs(extent[1]) * 0.05 || 1;
+                    range = [extent[0] === 0 ? 0 : extent[0] - pad, extent[1] + pad];
+                }
+                layout[axis] = Object.assign({}, layout[axis], {range: range, autorange: false});
+            });
+            return Object.assign({}, history, {data: data, layout: layout});
+        },
+
+        time_range: function (start, end) {
+            return 'From ' + start + ' to ' + end;
+        }
+    }
+});
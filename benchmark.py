@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Offline benchmark of the Controller update paths on Data/<id> and on synthetic copies
+# with 10x and 100x its history. Every case records the wall time with a cold and a warm
+# data cache, the peak memory allocated by the call and the serialized size of its
+# response. With a baseline saved by --save, a case that grew more than the tolerance
+# is reported as a regression:
+#   python benchmark.py --save
+#   python benchmark.py --scales 1 10
+
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+import utils
+from plotly.utils import PlotlyJSONEncoder
+from controller import Controller, data_cache
+from datastore import SCHEMAS
+from company_index import get_stock_dict
+
+BASELINE = 'benchmark_baseline.json'
+TOLERANCE = 0.25
+# Differences below these are noise whatever the tolerance says
+MIN_SECONDS = 0.02
+MIN_BYTES = 64 * 1024
+
+# Method, and whether it takes the selected date range
+CASES = [
+    ('get_data', False),
+    ('update_news', False),
+    ('update_price_figure', True),
+    ('update_revenue_figure', True),
+    ('update_financial_statements_figure', True),
+    ('update_per_ratio', False),
+    ('update_shareholding', True),
+    ('update_investors_figure', True),
+]
+
+# Days before the latest date of each benchmarked range, None for the whole history
+RANGES = {
+    '3m': 90,
+    '1y': 365,
+    'all': None,
+}
+
+MIN_YEAR = 1700
+
+
+def scale_dataset(df, factor):
+    # Copies of the history placed before it, shifted by whole multiples of its span in
+    # years so months and quarters keep their dates. Copies that would not fit in the
+    # datetime range are moved by whole minutes instead, which keeps the row count.
+    dates = pd.to_datetime(df['date'])
+    span = dates.max().year - dates.min().year + 1
+    fit = max((dates.min().year - MIN_YEAR - 1) // span, 1)
+
+    copies = []
+    for copy in range(factor - 1, -1, -1):
+        scaled = df.copy()
+        scaled['date'] = (dates - pd.DateOffset(years=span * (copy % fit)) +
+                          pd.Timedelta(minutes=copy // fit))
+        copies.append(scaled)
+    df = pd.concat(copies, ignore_index=True).sort_values('date', kind='mergesort')
+    df['date'] = df['date'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return df
+
+
+def make_scaled_data(data_dir, company_id, work_dir, factor):
+    scaled_dir = os.path.join(work_dir, 'x' + str(factor), '')
+    os.makedirs(scaled_dir + company_id, exist_ok=True)
+    for name in SCHEMAS:
+        path = data_dir + company_id + '/' + company_id + '_' + name + '.csv'
+        if not os.path.exists(path):
+            continue
+        try:
+            df = pd.read_csv(path, dtype={'stock_id': str})
+        except pd.errors.EmptyDataError:
+            shutil.copy(path, scaled_dir + company_id)
+            continue
+        scale_dataset(df, factor).to_csv(scaled_dir + company_id + '/' + company_id + '_' + name + '.csv',
+                                         index=False)
+    return scaled_dir
+
+
+def get_date_ranges(data_dir, company_id):
+    end = pd.read_csv(data_dir + company_id + '/' + company_id + '_Price.csv', usecols=['date'])['date'].max()
+    end = pd.Timestamp(end).normalize()
+    return {label: (str(MIN_YEAR) + '-01-01' if days is None else (end - pd.Timedelta(days=days)).strftime('%Y-%m-%d'),
+                    end.strftime('%Y-%m-%d'))
+            for label, days in RANGES.items()}
+
+
+def call(data_dir, company_id, method, args, eng_dict):
+    controller = Controller(data_dir, '', company_id)
+    if method == 'get_data':
+        return controller.get_data(eng_dict, '', False)
+    return getattr(controller, method)(*args)
+
+
+def run_case(data_dir, company_id, method, args, eng_dict, repeat):
+    # Cold: nothing cached, so the call includes reading the company's data
+    cold = []
+    for _ in range(repeat):
+        data_cache.clear()
+        start = time.perf_counter()
+        call(data_dir, company_id, method, args, eng_dict)
+        cold.append(time.perf_counter() - start)
+
+    warm = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = call(data_dir, company_id, method, args, eng_dict)
+        warm.append(time.perf_counter() - start)
+
+    data_cache.clear()
+    gc.collect()
+    tracemalloc.start()
+    call(data_dir, company_id, method, args, eng_dict)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'cold_seconds': round(min(cold), 4),
+        'warm_seconds': round(min(warm), 4),
+        'peak_bytes': peak,
+        'response_bytes': len(json.dumps(result, cls=PlotlyJSONEncoder)),
+    }
+
+
+def run(data_dir, company_id, scales, repeat, work_dir):
+    eng_dict = get_stock_dict()[1]
+    results = {}
+    for factor in scales:
+        scaled_dir = data_dir if factor == 1 else make_scaled_data(data_dir, company_id, work_dir, factor)
+        ranges = get_date_ranges(scaled_dir, company_id)
+        for method, ranged in CASES:
+            for label, args in (ranges.items() if ranged else [('', ())]):
+                key = 'x' + str(factor) + ' ' + method + (' ' + label if label else '')
+                results[key] = run_case(scaled_dir, company_id, method, args, eng_dict, repeat)
+                print(key + ' ' + json.dumps(results[key]))
+    return results
+
+
+def get_regressions(results, baseline, tolerance=TOLERANCE):
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric, minimum in (('cold_seconds', MIN_SECONDS), ('warm_seconds', MIN_SECONDS),
+                                ('peak_bytes', MIN_BYTES), ('response_bytes', MIN_BYTES)):
+            value, previous = result[metric], baseline[key][metric]
+            if value > previous * (1 + tolerance) and value - previous > minimum:
+                regressions.append(key + ' ' + metric + ' ' + str(value) + ' > ' + str(previous) + ' baseline')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Controller update paths offline')
+    parser.add_argument('--data-dir', default='./Data/')
+    parser.add_argument('--company-id', default='2330')
+    parser.add_argument('--scales', nargs='*', type=int, default=[1, 10, 100])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='save these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--work-dir', help='where the synthetic data is written, a temporary directory by default')
+    args = parser.parse_args()
+
+    # Offline mode only downloads missing datasets; make sure none of them reaches FinMind
+    utils.FINMIND_URL = 'http://127.0.0.1:9/'
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='finlookup-benchmark-')
+    try:
+        results = run(os.path.join(args.data_dir, ''), args.company_id, args.scales, args.repeat, work_dir)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.save:
+        with open(args.baseline, 'w', encoding='UTF-8') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print('Saved baseline to ' + args.baseline)
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='UTF-8') as file:
+            baseline = json.load(file)
+    regressions = get_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        print('Regression: ' + regression)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import threading
+from datastore import SCHEMAS
+from derive import DATASETS
+
+BUNDLE_DATASETS = list(SCHEMAS) + list(DATASETS)
+
+_building = {}
+_building_lock = threading.Lock()
+
+
+def get_latest_price(df):
+    close = df['close'].to_numpy()
+    up_down = close[-1] - close[-2]
+    return {
+        'price': close[-1],
+        'date': df.index[-1],
+        'up_down': up_down,
+        'percent': up_down * 100 / close[-2],
+    }
+
+
+def get_latest_statements(df):
+    # Statements of the latest reported date, values in millions except EPS
+    table = df[df['date'] == df['date'].iloc[-1]].copy()
+    is_eps = (table['type'] == 'EPS').to_numpy()
+    table['value'] = table['value'].where(is_eps, table['value'].map(lambda value: round(value / 1000000, 2)))
+    return table
+
+
+# Values shown for a company whatever date range is selected
+LATEST = {
+    'Price': get_latest_price,
+    'Revenue': lambda df: {'YoY': df['YoY'].iloc[-1], 'MoM': df['MoM'].iloc[-1]},
+    'Financial_Statements': lambda df: {'EPS': df[df['type'] == 'EPS']['value'].iloc[-1],
+                                        'statements': get_latest_statements(df)},
+    'PER': lambda df: {'PER': df['PER'].iloc[-1], 'PBR': df['PBR'].iloc[-1]},
+}
+
+
+# Every dataset of one company read in a single pass, with its latest values. A bundle
+# is built once per company and data version and shared by all the callbacks of a company
+# switch. Datasets that failed to load raise the same error when accessed. Latest values
+# are computed on first use, so a dataset too short for them only fails its own callbacks.
+class CompanyBundle:
+    def __init__(self, company_id, version, frames, errors):
+        self.company_id = company_id
+        self.version = version
+        self.frames = frames
+        self.errors = errors
+        self.latest = {}
+
+    def get(self, name):
+        if name in self.errors:
+            raise self.errors[name]
+        return self.frames[name]
+
+    def get_latest(self, name):
+        if name in self.errors:
+            raise self.errors[name]
+        latest = self.latest.get(name)
+        if latest is None:
+            latest = self.latest[name] = LATEST[name](self.frames[name])
+        return latest
+
+    def memory_usage(self, deep=True):
+        return sum(int(df.memory_usage(deep=deep).sum()) for df in self.frames.values())
+
+
+def get_bundle_version(store, company_id):
+    return tuple(store.get_version(company_id, name) for name in BUNDLE_DATASETS)
+
+
+def build_bundle(store, company_id, version):
+    frames = {}
+    errors = {}
+    for name in BUNDLE_DATASETS:
+        try:
+            frames[name] = store.read(company_id, name)
+        except (OSError, ValueError) as error:
+            errors[name] = error
+    return CompanyBundle(company_id, version, frames, errors)
+
+
+def load_bundle(store, company_id):
+    company_id = str(company_id)
+    version = get_bundle_version(store, company_id)
+    if store.cache is None:
+        return build_bundle(store, company_id, version)
+
+    key = ('bundle', company_id, version)
+    bundle = store.cache.get(key)
+    if bundle is not None:
+        return bundle
+
+    # Callbacks fired together by one company switch wait for a single build
+    with _building_lock:
+        lock = _building.setdefault(key, threading.Lock())
+    with lock:
+        bundle = store.cache.get(key)
+        if bundle is None:
+            store.cache.discard(lambda cached: cached[0] == 'bundle' and cached[1] == company_id)
+            bundle = store.cache.put(key, build_bundle(store, company_id, version))
+    with _building_lock:
+        _building.pop(key, None)
+    return bundle
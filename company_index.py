@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import json
+import os
+import sys
+import threading
+from utils import replace_file
+
+STOCK_TABLE = 'StockTable.json'
+INDEX_VERSION = 1
+SEARCH_LIMIT = 20
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def get_index_path(table_path):
+    return os.path.splitext(table_path)[0] + '.index.json'
+
+
+def get_source(table_path):
+    stat = os.stat(table_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+# Code, Chinese short name and English short name of every listed company, prebuilt from
+# StockTable.json into a small JSON file that is rebuilt whenever the table changes
+class CompanyIndex:
+    def __init__(self, companies):
+        self.companies = sorted(companies, key=lambda company: company[0])
+        self.codes = [company[0] for company in self.companies]
+        self.names = {company[0]: company for company in self.companies}
+        self._keys = [(code, tw_name.lower(), eng_name.lower()) for code, tw_name, eng_name in self.companies]
+
+    @classmethod
+    def build(cls, table_path=STOCK_TABLE):
+        with open(table_path, 'r', encoding='UTF-8') as file:
+            table = json.load(file)
+        return cls([(row['公司代號'].strip(), row['公司簡稱'].strip(), row['英文簡稱'].strip()) for row in table])
+
+    @classmethod
+    def load(cls, table_path=STOCK_TABLE):
+        index_path = get_index_path(table_path)
+        source = get_source(table_path)
+        try:
+            with open(index_path, 'r', encoding='UTF-8') as file:
+                index = json.load(file)
+            if index['version'] == INDEX_VERSION and index['source'] == source:
+                return cls([tuple(company) for company in index['companies']])
+        except (OSError, ValueError, KeyError):
+            pass
+
+        company_index = cls.build(table_path)
+        try:
+            company_index.save(index_path, source)
+        except OSError:
+            pass
+        return company_index
+
+    def save(self, index_path, source):
+        def write(path):
+            with open(path, 'w', encoding='UTF-8') as file:
+                json.dump({'version': INDEX_VERSION, 'source': source, 'companies': self.companies},
+                          file, ensure_ascii=False, separators=(',', ':'))
+
+        replace_file(index_path, write)
+
+    def get_dicts(self):
+        # {company id: Chinese short name} and {company id: English short name} with integer ids
+        tw_dict = {int(code): tw_name for code, tw_name, _ in self.companies}
+        eng_dict = {int(code): eng_name for code, _, eng_name in self.companies}
+        return tw_dict, eng_dict
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        # Codes ranked by exact code, code prefix, name prefix, then substring of code or names
+        text = str(text or '').strip().lower()
+        if not text:
+            return self.codes[:limit]
+
+        ranked = []
+        for code, tw_name, eng_name in self._keys:
+            if code == text:
+                rank = 0
+            elif code.startswith(text):
+                rank = 1
+            elif tw_name.startswith(text) or eng_name.startswith(text):
+                rank = 2
+            elif text in code or text in tw_name or text in eng_name:
+                rank = 3
+            else:
+                continue
+            ranked.append((rank, code))
+        ranked.sort()
+        return [code for _, code in ranked[:limit]]
+
+    def get_label(self, code):
+        code, tw_name, eng_name = self.names[str(code)]
+        return code + ' ' + tw_name + ' ' + eng_name
+
+    def get_options(self, codes, selected=None):
+        # Dropdown options; the selected company is always kept so its label stays visible
+        codes = list(codes)
+        if selected is not None and str(selected) in self.names and str(selected) not in codes:
+            codes.insert(0, str(selected))
+        return [{'label': self.get_label(code), 'value': int(code)} for code in codes]
+
+
+def get_company_index(table_path=STOCK_TABLE):
+    with _loaded_lock:
+        if table_path not in _loaded:
+            _loaded[table_path] = CompanyIndex.load(table_path)
+        return _loaded[table_path]
+
+
+def get_stock_dict(table_path=STOCK_TABLE):
+    return get_company_index(table_path).get_dicts()
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else STOCK_TABLE
+    company_index = CompanyIndex.build(path)
+    company_index.save(get_index_path(path), get_source(path))
+    print(str(len(company_index.companies)) + ' companies written to ' + get_index_path(path))
@@ -1,14 +1,38 @@
 import pandas as pd
 import os
+from datetime import datetime
 import plotly.graph_objs as go
 from pandas.errors import EmptyDataError
 from plotly.subplots import make_subplots
-from datetime import datetime, date, timedelta
-from wordcloud import WordCloud
 import dash_bootstrap_components as dbc
-import plotly.express as px
-from utils import check_dir, get_data_from_finmind
-from nlp import get_tfidf, get_news, Tokenizer
+from utils import check_dir, get_datasets_from_finmind
+from datastore import DataStore, SCHEMAS
+from cache import DataFrameCache
+from query import query, rolling_sum
+from bundle import load_bundle
+from metrics import timed, reading
+from resample import get_frequency, resample, resample_ohlc, resample_sum, downsample_line
+from derive import INVESTOR_COLUMNS
+from screener import screen, has_panel, schedule_update
+
+WORD_CLOUD_DIR = 'Word_Cloud/'
+DATA_CACHE_BYTES = 512 * 1024 ** 2
+
+MARGIN_NAMES = {
+    'GrossMargin': 'Gross Margin',
+    'OperatingMargin': 'Operating Margin',
+    'NetMargin': 'Net Margin',
+}
+
+INVESTOR_NAMES = {
+    'Foreign': 'Foreign Investors',
+    'Investment_Trust': 'Investment Trust',
+    'Dealer': 'Dealers',
+}
+# Trading days in the rolling net flow of the Investors tab
+INVESTORS_WINDOW = 20
+
+data_cache = DataFrameCache(DATA_CACHE_BYTES)
 
 
 def open_collapse(n, is_open):
@@ -17,79 +41,94 @@ def open_collapse(n, is_open):
     return is_open
 
 
+def get_stack_bases(df):
+    # Bar bases that stack the columns like barmode='relative', buys upward and sells downward,
+    # so one subplot can stack while the others stay grouped
+    buys = df.clip(lower=0)
+    sells = df.clip(upper=0)
+    return (buys.cumsum(axis=1) - buys).where(df >= 0, sells.cumsum(axis=1) - sells)
+
+
+def update_screener(data_dir, text, sort_by, ascending, company_index):
+    # Market-wide table of the screener panel with each company's short name
+    try:
+        if not has_panel(data_dir):
+            raise ValueError('No screener panel yet, run `python screener.py` to build it')
+        rows, count = screen(data_dir, text, sort_by, ascending)
+    except ValueError as error:
+        table = pd.DataFrame([str(error)], columns=['Status'])
+        return dbc.Table.from_dataframe(table, striped=True, bordered=False, hover=True, responsive=True), ''
+
+    table = rows.round(2).fillna('')
+    table.insert(1, 'Name', [company_index.names.get(code, (code, '', ''))[1] for code in table['stock_id']])
+    table = dbc.Table.from_dataframe(
+        table, striped=True, bordered=False, hover=True, responsive=True)
+    return table, str(count) + ' companies'
+
+
+def compact_figure(fig):
+    # Dates as YYYY-MM-DD strings, about half the size of serialized timestamps
+    for trace in fig.data:
+        if trace.x is not None and len(trace.x) and isinstance(trace.x[0], datetime):
+            trace.x = pd.DatetimeIndex(trace.x).strftime('%Y-%m-%d')
+    return fig
+
+
 class Controller:
-    def __init__(self, data_dir, font_dir, company_id):
+    # max_points switches the price figure to a close line downsampled to that many points
+    # and caps the points of the other daily line traces
+    def __init__(self, data_dir, font_dir, company_id, cache=data_cache, max_points=None):
         self.data_dir = data_dir
         self.dir_ = self.get_data_dir(data_dir, company_id)
         self.font_dir = font_dir
         self.company_id = str(company_id)
-
-    def reset(self, company_id):
-        self.company_id = str(company_id)
+        self.store = DataStore(data_dir, cache)
+        self.max_points = max_points
+        self._bundle = None
 
     @staticmethod
     def get_data_dir(data_dir, company_id):
         return data_dir + str(company_id) + "/"
 
-    def get_data(self, eng_dict, token, online_mode):
+    @timed
+    def get_data(self, eng_dict, token, online_mode, full_sync=False):
         company_id = self.company_id
 
         check_dir(company_id, self.data_dir)
 
-        dir_ = self.dir_
-        alert = False
-        error = []
-
-        for dirPath, dirNames, fileNames in os.walk(dir_):
-            if company_id + '_Price.csv' not in fileNames or online_mode:
-                alert = True
-                error.append(get_data_from_finmind("TaiwanStockPrice", company_id, token,
-                                                   "2009-01-01", dir_ + company_id + '_Price.csv'))
-
-            if company_id + '_Revenue.csv' not in fileNames or online_mode:
-                alert = True
-                error.append(get_data_from_finmind("TaiwanStockMonthRevenue", company_id, token,
-                                                   "2008-01-01", dir_ + company_id + '_Revenue.csv'))
-
-            if company_id + '_Investors_Buy_Sell.csv' not in fileNames or online_mode:
-                alert = True
-                error.append(get_data_from_finmind("TaiwanStockInstitutionalInvestorsBuySell", company_id, token,
-                                                   "2008-01-01", dir_ + company_id + '_Investors_Buy_Sell.csv'))
-
-            if company_id + '_PER.csv' not in fileNames or online_mode:
-                alert = True
-                error.append(get_data_from_finmind("TaiwanStockPER", company_id, token, (date.today(
-                ) - timedelta(days=90)).isoformat(), dir_ + company_id + '_PER.csv'))
-            if company_id + '_Financial_Statements.csv' not in fileNames or online_mode:
-                alert = True
-                error.append(get_data_from_finmind("TaiwanStockFinancialStatements", company_id, token,
-                                                   "2008-01-01", dir_ + company_id + '_Financial_Statements.csv'))
-            if company_id + '_Margin_Trading.csv' not in fileNames or online_mode:
-                alert = True
-                error.append(get_data_from_finmind("TaiwanStockMarginPurchaseShortSale", company_id, token,
-                                                   "2008-01-01", dir_ + company_id + '_Margin_Trading.csv'))
-            if company_id + '_Shareholding.csv' not in fileNames or online_mode:
-                alert = True
-                error.append(get_data_from_finmind("TaiwanStockShareholding", company_id, token,
-                                                   "2008-01-01", dir_ + company_id + '_Shareholding.csv'))
-            if company_id + '_News.csv' not in fileNames or online_mode:
-                alert = True
-                error.append(get_data_from_finmind("TaiwanStockNews", company_id, token,
-                                                   (date.today() - timedelta(days=20)).isoformat(),
-                                                   dir_ + company_id + '_News.csv'))
+        file_names = os.listdir(self.dir_)
+        names = [name for name in SCHEMAS if online_mode or company_id + '_' + name + '.csv' not in file_names]
+        alert = len(names) > 0
+
+        downloads = [self.store.get_download(company_id, name) for name in names]
+        with reading():
+            error = get_datasets_from_finmind(downloads, token, sync=not full_sync)
+
         if online_mode:
             alert = False
+        # Rebuild the screener row in the background if the files changed, here or in another process
+        schedule_update(self.data_dir, company_id)
 
         return eng_dict[int(company_id)] + ' Information', company_id, alert, online_mode & (not any(error)), any(
             error), ' <br>\r\n'.join(error)
 
+    @property
+    def bundle(self):
+        if self._bundle is None:
+            with reading():
+                self._bundle = load_bundle(self.store, self.company_id)
+        return self._bundle
+
+    def load(self, name):
+        return self.bundle.get(name)
+
+    @timed
     def update_news(self):
-        company_id = self.company_id
-        dir_ = self.dir_
         try:
-            data = pd.read_csv(dir_ + company_id + '_News.csv')
+            data = self.load('News')
             data = data.sort_values(by=['date'], ascending=False)
             table = data[['date', 'title']].copy()
+            table['date'] = table['date'].dt.strftime('%Y-%m-%d %H:%M:%S')
             table.columns = ['Date', 'Title']
         except EmptyDataError:
             table = pd.DataFrame(['No Data'], columns=['Status'])
@@ -99,24 +138,17 @@ class Controller:
 
         return table
 
+    @timed
     def update_price_figure(self, start_date, end_date):
-        dir_ = self.dir_
-        company_id = self.company_id
-        df_price = pd.read_csv(dir_ + company_id + '_Price.csv')
-        df_price.index = pd.to_datetime(df_price['date'])
-
-        df_investors_buy_sell = pd.read_csv(
-            dir_ + company_id + '_Investors_Buy_Sell.csv')
-        df_investors_buy_sell.index = pd.to_datetime(df_investors_buy_sell['date'])
-
-        df_margin_trading = pd.read_csv(
-            dir_ + company_id + '_Margin_Trading.csv')
-        df_margin_trading.index = pd.to_datetime(df_margin_trading['date'])
+        df_price = self.load('Price')
+        df_investors_net = self.load('Investors_Net')
+        df_margin_trading = self.load('Margin_Trading')
 
-        latest_price = df_price.iloc[-1].close
-        latest_date = "Latest updated at " + str(df_price.iloc[-1].date)
-        latest_up_down = df_price.iloc[-1].close - df_price.iloc[-2].close
-        latest_percent = latest_up_down * 100 / df_price.iloc[-2].close
+        latest = self.bundle.get_latest('Price')
+        latest_price = latest['price']
+        latest_date = "Latest updated at " + latest['date'].strftime('%Y-%m-%d')
+        latest_up_down = latest['up_down']
+        latest_percent = latest['percent']
 
         if latest_up_down > 0:
             latest_up_down = '▲ ' + \
@@ -131,19 +163,12 @@ class Controller:
 
         latest_style = {'textAlign': 'center', 'color': latest_color}
 
-        filtered_df_price = df_price[(df_price.index >= start_date)
-                                     & (df_price.index <= end_date)].copy()
-
-        filtered_df_investors_buy_sell = df_investors_buy_sell[(df_investors_buy_sell.index >= start_date)
-                                                               & (df_investors_buy_sell.index <= end_date)].copy()
-
-        filtered_df_margin_trading = df_margin_trading[(df_margin_trading.index >= start_date) & (
-                df_margin_trading.index <= end_date)].copy()
-
-        filtered_df_investors_buy_sell.insert(
-            2, "Net", filtered_df_investors_buy_sell.buy - filtered_df_investors_buy_sell.sell, True)
-        filtered_df_investors_buy_sell = filtered_df_investors_buy_sell.groupby(
-            filtered_df_investors_buy_sell.index).sum()
+        freq = get_frequency(start_date, end_date)
+        filtered_df_price = resample_ohlc(query(df_price, start_date, end_date), freq)
+        filtered_df_investors_net = resample_sum(query(df_investors_net, start_date, end_date), freq,
+                                                 INVESTOR_COLUMNS)
+        filtered_df_margin_trading = resample_sum(query(df_margin_trading, start_date, end_date), freq,
+                                                  ['NetMarginTrading', 'NetShortSelling'])
 
         fig = make_subplots(rows=4, cols=1,
                             shared_xaxes=True,
@@ -155,16 +180,11 @@ class Controller:
 
         fig.add_trace(go.Bar(x=filtered_df_price.index,
                              y=filtered_df_price.Trading_Volume, name='Trading Volume'), row=2, col=1)
-        fig.add_trace(go.Bar(x=filtered_df_investors_buy_sell.index,
-                             y=filtered_df_investors_buy_sell.Net, name='Net Volume'), row=3, col=1)
-
-        filtered_df_margin_trading.insert(2, "NetMarginTrading", filtered_df_margin_trading.MarginPurchaseBuy -
-                                          filtered_df_margin_trading.MarginPurchaseSell -
-                                          filtered_df_margin_trading.MarginPurchaseCashRepayment, True)
-
-        filtered_df_margin_trading.insert(2, 'NetShortSelling', filtered_df_margin_trading.ShortSaleSell -
-                                          filtered_df_margin_trading.ShortSaleBuy -
-                                          filtered_df_margin_trading.ShortSaleCashRepayment, True)
+        investors = filtered_df_investors_net[INVESTOR_COLUMNS]
+        bases = get_stack_bases(investors)
+        for column in INVESTOR_COLUMNS:
+            fig.add_trace(go.Bar(x=investors.index, y=investors[column], base=bases[column], offsetgroup='investors',
+                                 name=INVESTOR_NAMES[column]), row=3, col=1)
 
         fig.add_trace(go.Bar(x=filtered_df_margin_trading.index,
                              y=filtered_df_margin_trading.NetMarginTrading, name='Margin Trading'), row=4, col=1)
@@ -172,12 +192,9 @@ class Controller:
         fig.add_trace(go.Bar(x=filtered_df_margin_trading.index,
                              y=filtered_df_margin_trading.NetShortSelling, name='Short Selling'), row=4, col=1)
 
-        max_buy_sell = max([abs(buy_sell)
-                            for buy_sell in filtered_df_investors_buy_sell.Net])
+        max_buy_sell = max(investors.clip(lower=0).sum(axis=1).max(), -investors.clip(upper=0).sum(axis=1).min())
 
-        max_margin_short = max([abs(value)
-                                for value in filtered_df_margin_trading.NetMarginTrading.append(
-                filtered_df_margin_trading.NetShortSelling)])
+        max_margin_short = filtered_df_margin_trading[['NetMarginTrading', 'NetShortSelling']].abs().max().max()
 
         fig.update_yaxes(range=[-max_buy_sell * 1.1,
                                 max_buy_sell * 1.1], row=3, col=1)
@@ -185,12 +202,16 @@ class Controller:
         fig.update_yaxes(range=[-max_margin_short * 1.1,
                                 max_margin_short * 1.1], row=4, col=1)
 
-        fig.add_trace(go.Candlestick(x=filtered_df_price.index,
-                                     open=filtered_df_price['open'],
-                                     high=filtered_df_price['max'],
-                                     low=filtered_df_price['min'],
-                                     close=filtered_df_price['close'],
-                                     name='Price'), row=1, col=1)
+        if self.max_points:
+            line = downsample_line(query(df_price, start_date, end_date), 'close', self.max_points)
+            fig.add_trace(go.Scatter(x=line.index, y=line['close'], mode='lines', name='Price'), row=1, col=1)
+        else:
+            fig.add_trace(go.Candlestick(x=filtered_df_price.index,
+                                         open=filtered_df_price['open'],
+                                         high=filtered_df_price['max'],
+                                         low=filtered_df_price['min'],
+                                         close=filtered_df_price['close'],
+                                         name='Price'), row=1, col=1)
 
         fig.update_xaxes(
             rangeslider_visible=False)
@@ -205,30 +226,48 @@ class Controller:
         return fig, 'From ' + str(start_date) + ' to ' + str(end_date), str(round(latest_price, 2)), str(
             latest_up_down), latest_style, latest_style, latest_date
 
-    def update_revenue_figure(self, start_date, end_date):
-        dir_ = self.dir_
-        company_id = self.company_id
+    @timed
+    def update_investors_figure(self, start_date, end_date):
+        df = self.load('Investors_Net')[INVESTOR_COLUMNS]
+
+        # Both are column-wise over the stored matrix; the range is a slice, never a regroup
+        cumulative = query(df, start_date, end_date).cumsum()
+        rolling = rolling_sum(df, start_date, end_date, INVESTORS_WINDOW)
+
+        freq = get_frequency(start_date, end_date)
+        last = {column: 'last' for column in INVESTOR_COLUMNS}
+        cumulative = resample(cumulative, freq, last)
+        rolling = resample(rolling, freq, last)
 
-        df_revenue = pd.read_csv(dir_ + company_id + '_Revenue.csv')
-        df_revenue.date = df_revenue.date.copy().shift(1)
-        df_revenue.index = pd.to_datetime(df_revenue['date'])
+        fig = make_subplots(rows=2, cols=1,
+                            shared_xaxes=True,
+                            vertical_spacing=0.1,
+                            subplot_titles=("Cumulative Net Buy & Sell",
+                                            str(INVESTORS_WINDOW) + "-Day Net Buy & Sell")
+                            )
+
+        bases = get_stack_bases(rolling)
+        for column in INVESTOR_COLUMNS:
+            # meta marks the lines assets/range.js restarts from zero at the range start
+            fig.add_trace(go.Scatter(x=cumulative.index, y=cumulative[column], mode='lines', meta='cumulative',
+                                     name=INVESTOR_NAMES[column], legendgroup=column), row=1, col=1)
+            fig.add_trace(go.Bar(x=rolling.index, y=rolling[column], base=bases[column], offsetgroup='investors',
+                                 name=INVESTOR_NAMES[column], legendgroup=column, showlegend=False), row=2, col=1)
+
+        fig.update_layout(legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1), margin=dict(l=20, r=50, t=50, b=50), height=450, hovermode='x unified')
 
-        df_revenue['MoM'] = (df_revenue.revenue /
-                             df_revenue.revenue.shift(1) - 1) * 100
-        df_revenue['YoY'] = (df_revenue.revenue /
-                             df_revenue.revenue.shift(12) - 1) * 100
+        return fig
 
-        df_revenue = df_revenue.round({'YoY': 2, 'MoM': 2})
+    @timed
+    def update_revenue_figure(self, start_date, end_date):
+        df_revenue = self.load('Revenue')
 
-        if (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")) > timedelta(days=365):
-            filtered_df_revenue = df_revenue[
-                (df_revenue.index >= start_date)
-                & (df_revenue.index <= end_date)]
-        else:
-            filtered_df_revenue = df_revenue[
-                (df_revenue.index >= datetime(year=datetime.strptime(
-                    end_date, "%Y-%m-%d").year - 1, month=1, day=1))
-                & (df_revenue.index <= end_date)]
+        filtered_df_revenue = query(df_revenue, start_date, end_date, 'Revenue')
 
         fig = make_subplots(rows=2, cols=1,
                             shared_xaxes=True,
@@ -259,9 +298,10 @@ class Controller:
         fig.update_yaxes(range=[-max_ratio * 1.1, max_ratio *
                                 1.1], ticksuffix="%", row=2, col=1)
 
-        table = filtered_df_revenue[['date', 'revenue', 'YoY', 'MoM']]
+        table = filtered_df_revenue[['period', 'revenue', 'YoY', 'MoM']].copy()
 
-        table.loc[:, 'revenue'] = table['revenue'].to_numpy() / 1000000
+        table['period'] = table['period'].dt.strftime('%Y-%m-%d')
+        table['revenue'] = table['revenue'].to_numpy() / 1000000
 
         table.columns = ['Date', 'Revenue (M)', 'YoY (%)', 'MoM (%)']
 
@@ -272,41 +312,34 @@ class Controller:
         table = dbc.Table.from_dataframe(
             table, striped=True, bordered=False, hover=True, responsive=True)
 
-        return fig, table, str(round(df_revenue['YoY'].iloc[-1], 1)) + '%', str(
-            round(df_revenue['MoM'].iloc[-1], 1)) + '%'
+        latest = self.bundle.get_latest('Revenue')
 
+        return fig, table, str(round(latest['YoY'], 1)) + '%', str(round(latest['MoM'], 1)) + '%'
+
+    @timed
     def update_financial_statements_figure(self, start_date, end_date):
-        dir_ = self.dir_
-        company_id = self.company_id
-        df = pd.read_csv(dir_ + company_id + '_Financial_Statements.csv')
-        df.index = pd.to_datetime(df['date'])
+        df = self.load('Statements')
 
-        latest_eps = df[df['type'] == 'EPS'].iloc[-1].value
+        latest = self.bundle.get_latest('Financial_Statements')
+        latest_eps = latest['EPS']
 
-        if (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")) > timedelta(
-                days=5 * 365):
-            filtered_df = df[(df.index >= start_date)
-                             & (df.index <= end_date)]
-        else:
-            filtered_df = df[
-                (df.index >= datetime(year=datetime.strptime(end_date, "%Y-%m-%d").year - 5, month=1, day=1))
-                & (df.index <= end_date)]
+        filtered_df = query(df, start_date, end_date, 'Statements')
+        eps = filtered_df['EPS'].dropna()
+        gross_margin = filtered_df['GrossMargin'].dropna()
 
         fig = make_subplots(rows=2, cols=1,
                             shared_xaxes=True,
                             vertical_spacing=0.1,
-                            subplot_titles=("EPS", "Gross Margin")
+                            subplot_titles=("EPS", "Margins")
                             )
-        gross_margin = round(filtered_df[filtered_df['type'] == 'GrossProfit'].value * 100 / filtered_df[
-            filtered_df['type'] == 'Revenue'].value, 2)
 
-        latest_gross_margin = round(gross_margin[-1], 1)
+        latest_gross_margin = round(gross_margin.iloc[-1], 1)
 
-        fig.add_trace(go.Scatter(x=filtered_df[filtered_df['type'] == 'EPS'].index,
-                                 y=filtered_df[filtered_df['type'] == 'EPS'].value, mode="lines+markers", name='EPS'),
-                      row=1, col=1)
-        fig.add_trace(go.Scatter(x=filtered_df[filtered_df['type'] == 'Revenue'].index,
-                                 y=gross_margin, mode="lines+markers", name='Gross Margin'), row=2, col=1)
+        fig.add_trace(go.Scatter(x=eps.index, y=eps, mode="lines+markers", name='EPS'), row=1, col=1)
+        for column, name in MARGIN_NAMES.items():
+            margin = filtered_df[column].dropna()
+            fig.add_trace(go.Scatter(x=margin.index,
+                                     y=margin, mode="lines+markers", name=name), row=2, col=1)
 
         fig.update_yaxes(ticksuffix="%", row=2, col=1)
 
@@ -317,46 +350,34 @@ class Controller:
             xanchor="right",
             x=1), margin=dict(l=20, r=50, t=50, b=50), height=450, showlegend=False, hovermode='x unified')
 
-        table = df[df['date'] == df.iloc[-1].date]
-
-        value = []
-
-        for row in table.iterrows():
-            if row[1].type != 'EPS':
-                value.append(round(row[1].value / 1000000, 2))
-            else:
-                value.append(row[1].value)
-
-        table.loc[:, 'value'] = value
-
-        table.columns = ['Date', 'Stock Id', 'Type', 'Value (M)', df.iloc[-1].date]
-        table = table[[df.iloc[-1].date, 'Value (M)']]
+        # Growth of every line item is a column of the pivoted statements, looked up by name
+        latest_date = df.index[-1].strftime('%Y-%m-%d')
+        statements = latest['statements']
+        types = statements['type'].astype(str)
+        ratios = df.iloc[-1]
+        table = pd.DataFrame({
+            latest_date: statements['origin_name'].to_numpy(),
+            'Value (M)': statements['value'].to_numpy(),
+            'QoQ (%)': ratios.reindex(types + '_QoQ').to_numpy(),
+            'YoY (%)': ratios.reindex(types + '_YoY').to_numpy(),
+        }).fillna('')
 
         table = dbc.Table.from_dataframe(
             table, striped=True, bordered=False, hover=True, responsive=True)
 
         return fig, table, str(latest_eps), str(latest_gross_margin) + "%"
 
+    @timed
     def update_per_ratio(self):
-        dir_ = self.dir_
-        company_id = self.company_id
-        df = pd.read_csv(dir_ + company_id + '_PER.csv')
-        return str(df.iloc[-1].PER), str(df.iloc[-1].PBR)
+        latest = self.bundle.get_latest('PER')
+        return str(latest['PER']), str(latest['PBR'])
 
+    @timed
     def update_shareholding(self, start_date, end_date):
-        dir_ = self.dir_
-        company_id = self.company_id
-        df = pd.read_csv(dir_ + company_id + '_Shareholding.csv')
-        df.index = pd.to_datetime(df['date'])
+        df = self.load('Shareholding')
 
-        if (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")) > timedelta(
-                days=5 * 365):
-            filtered_df = df[(df.index >= start_date)
-                             & (df.index <= end_date)]
-        else:
-            filtered_df = df[
-                (df.index >= datetime(year=datetime.strptime(end_date, "%Y-%m-%d").year - 5, month=1, day=1))
-                & (df.index <= end_date)]
+        filtered_df = query(df, start_date, end_date, 'Shareholding')
+        filtered_df = downsample_line(filtered_df, 'ForeignInvestmentShares', self.max_points)
 
         fig = make_subplots(subplot_titles=("Foreign Investors' Shareholding",))
         fig.add_trace(go.Scatter(x=filtered_df.index, y=round(100 * filtered_df.ForeignInvestmentShares /
@@ -376,29 +397,40 @@ class Controller:
 
         return fig
 
-    def update_nlp_news(self, n):
+    def get_news_word_cloud(self):
+        # The NLP and imaging stack (CKIP Transformers with torch, sklearn, wordcloud) is
+        # imported here, on the first NLP Analysis, so that it stays out of startup
+        from nlp import get_tfidf, get_news, Tokenizer
+        from ner_cache import NerCache
+        from idf_index import DocumentFrequencyIndex, INDEX_DIR
+        from word_cloud import render_word_cloud, get_word_cloud_figure
+
         dir_ = self.dir_
         company_id = self.company_id
+        df = get_news(self.load('News'))
+        tokenizer = Tokenizer(ner_only=True)
+        # df['Tokenized Title'] = df['title'].apply(tokenize)
+        # df['Tokenized Title'] = df['Tokenized Title'].apply(to_list)
+        # df['Tokenized Title'] = df['Tokenized Title'].apply(clean)
+        ner_cache = NerCache(dir_, company_id, tokenizer.service.signature)
+        df['NER'] = ner_cache.get_entities(df, tokenizer)
+        df['NER Content'] = df['NER'].apply(tokenizer.get_word_from_ner_dict)
+        df['NER Content'] = df['NER Content'].apply(tokenizer.clean)
+
+        idf_index = DocumentFrequencyIndex.load_cached(self.data_dir + INDEX_DIR, tokenizer.service.signature)
+        if idf_index is not None and idf_index.update(df['link'], df['NER Content']):
+            idf_index.save()
+
+        ner_document = [" ".join(content) for content in df['NER Content']]
+        df_tf, df_tfidf, df_sum_tfidf = get_tfidf(ner_document, df, idf_index=idf_index)
+        word_cloud = render_word_cloud(df_sum_tfidf['TF-IDF'].to_dict(), self.font_dir,
+                                       cache_dir=self.data_dir + WORD_CLOUD_DIR)
+        return get_word_cloud_figure(word_cloud)
+
+    @timed
+    def update_nlp_news(self, n):
         if n % 2 == 1:
-            df = get_news(company_id, dir_)
-            tokenizer = Tokenizer()
-            # df['Tokenized Title'] = df['title'].apply(tokenize)
-            # df['Tokenized Title'] = df['Tokenized Title'].apply(to_list)
-            # df['Tokenized Title'] = df['Tokenized Title'].apply(clean)
-            df['NER'] = df['title'].apply(tokenizer.tokenize_ner)
-            df['NER Content'] = df['NER'].apply(tokenizer.get_word_from_ner_dict)
-            df['NER Content'] = df['NER Content'].apply(tokenizer.clean)
-            # df.to_pickle(dir_ + company_id + "_News_NER.pkl")
-            ner_document = [" ".join(content) for content in df['NER Content']]
-            df_tf, df_tfidf, df_sum_tfidf = get_tfidf(ner_document, df)
-            word_cloud = WordCloud(background_color='white', font_path=self.font_dir, width=800,
-                                   height=400).generate_from_frequencies(frequencies=df_sum_tfidf['TF-IDF'].to_dict())
-
-            # img = BytesIO()
-            # word_cloud.to_image().save(img, format='PNG')
-            # return 'data:image/png;base64,{}'.format(base64.b64encode(img.getvalue()).decode())
-            fig = px.imshow(word_cloud)
-
+            fig = self.get_news_word_cloud()
         else:
             layout = go.Layout(
                 paper_bgcolor='rgba(0,0,0,0)',
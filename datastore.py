@@ -0,0 +1,310 @@
+import os
+import sys
+import time
+from datetime import date, timedelta
+import pandas as pd
+from utils import replace_file, TIMEOUT
+from derive import derive_columns, derive_dataset, get_source, get_derived_datasets, get_derive_version
+from query import to_time_series
+from metrics import FILE_READ_SECONDS
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+# Declared schema of every FinMind dataset kept per company. Text columns that repeat
+# on every row are stored as categoricals and integers get the smallest dtype that
+# still leaves headroom for the arithmetic done on them. `key` identifies a row when
+# new rows are merged in; `overlap` re-fetches the last stored day during a sync, for
+# datasets with several rows per date. `ttl` is how many seconds a FinMind response is
+# reused, DEFAULT_TTL when not set.
+DEFAULT_TTL = 600
+
+SCHEMAS = {
+    'Price': {
+        'dataset': 'TaiwanStockPrice',
+        'key': ['date'],
+        'start_date': '2009-01-01',
+        'categories': ['stock_id'],
+        'dtypes': {'Trading_Volume': 'int64', 'Trading_money': 'int64', 'Trading_turnover': 'int32'},
+    },
+    'Revenue': {
+        'dataset': 'TaiwanStockMonthRevenue',
+        'key': ['date'],
+        'start_date': '2008-01-01',
+        'categories': ['stock_id', 'country'],
+        'dtypes': {'revenue': 'int64', 'revenue_month': 'int8', 'revenue_year': 'int16'},
+        'index': 'period',
+        'ttl': 6 * 3600,
+    },
+    'Investors_Buy_Sell': {
+        'dataset': 'TaiwanStockInstitutionalInvestorsBuySell',
+        'key': ['date', 'name'],
+        'overlap': True,
+        'start_date': '2008-01-01',
+        'timeout': 60,
+        'categories': ['stock_id', 'name'],
+        'dtypes': {'buy': 'int64', 'sell': 'int64'},
+        'unique': False,
+    },
+    'PER': {
+        'dataset': 'TaiwanStockPER',
+        'key': ['date'],
+        'days': 90,
+        'categories': ['stock_id'],
+        'dtypes': {},
+    },
+    'Financial_Statements': {
+        'dataset': 'TaiwanStockFinancialStatements',
+        'key': ['date', 'type'],
+        'overlap': True,
+        'start_date': '2008-01-01',
+        'categories': ['stock_id', 'type', 'origin_name'],
+        'dtypes': {},
+        'unique': False,
+        'ttl': 24 * 3600,
+    },
+    'Margin_Trading': {
+        'dataset': 'TaiwanStockMarginPurchaseShortSale',
+        'key': ['date'],
+        'start_date': '2008-01-01',
+        'categories': ['stock_id', 'Note'],
+        'dtypes': {'MarginPurchaseBuy': 'int32', 'MarginPurchaseCashRepayment': 'int32',
+                   'MarginPurchaseLimit': 'int64', 'MarginPurchaseSell': 'int32',
+                   'MarginPurchaseTodayBalance': 'int32', 'MarginPurchaseYesterdayBalance': 'int32',
+                   'OffsetLoanAndShort': 'int32', 'ShortSaleBuy': 'int32', 'ShortSaleCashRepayment': 'int32',
+                   'ShortSaleLimit': 'int64', 'ShortSaleSell': 'int32', 'ShortSaleTodayBalance': 'int32',
+                   'ShortSaleYesterdayBalance': 'int32'},
+    },
+    'Shareholding': {
+        'dataset': 'TaiwanStockShareholding',
+        'key': ['date'],
+        'start_date': '2008-01-01',
+        'categories': ['stock_id', 'stock_name', 'InternationalCode', 'RecentlyDeclareDate', 'note'],
+        'dtypes': {'ForeignInvestmentRemainingShares': 'int64', 'ForeignInvestmentShares': 'int64',
+                   'NumberOfSharesIssued': 'int64'},
+    },
+    'News': {
+        'dataset': 'TaiwanStockNews',
+        'key': ['date', 'link'],
+        'days': 20,
+        'overlap': True,
+        'ttl': 300,
+        'categories': ['stock_id', 'source'],
+        'dtypes': {},
+        'unique': False,
+    },
+}
+
+ARROW_EXT = '.feather'
+# Bumped when SCHEMAS changes how stored columns are typed. Every Feather file records it
+# with the derive version of its dataset and is converted again when either differs.
+ARROW_VERSION = 1
+ARROW_VERSION_KEY = b'finlookup_version'
+
+
+def get_arrow_version(name):
+    return (str(ARROW_VERSION) + '.' + str(get_derive_version(name))).encode('utf-8')
+
+
+def get_start_date(name):
+    schema = SCHEMAS[name]
+    if 'days' in schema:
+        return (date.today() - timedelta(days=schema['days'])).isoformat()
+    return schema['start_date']
+
+
+def apply_schema(df, name):
+    schema = SCHEMAS[name]
+    df['date'] = pd.to_datetime(df['date'])
+    for column in schema['categories']:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    for column, dtype in schema['dtypes'].items():
+        if column in df.columns and df[column].notna().all():
+            try:
+                df[column] = df[column].astype(dtype)
+            except (ValueError, TypeError):
+                pass
+    return df
+
+
+def read_csv(path, name):
+    df = pd.read_csv(path, dtype={column: str for column in SCHEMAS[name]['categories']})
+    return apply_schema(df, name)
+
+
+def set_date_index(df, name):
+    schema = SCHEMAS.get(name, {})
+    df.index = pd.DatetimeIndex(df[schema.get('index', 'date')].values)
+    return to_time_series(df, schema.get('unique', True))
+
+
+class DataStore:
+    # Loads the per-company datasets. CSV files written by the crawler are converted
+    # once into memory-mappable Arrow IPC (Feather) files with the declared schema and
+    # every later load reads the Arrow file until the CSV changes again. With a cache,
+    # loaded frames are kept in memory keyed by the source file's mtime and size.
+    # Derived columns and datasets (see derive.py) are computed during the conversion,
+    # only for the rows appended since the previous one, and stored with the data.
+    def __init__(self, data_dir, cache=None):
+        self.data_dir = data_dir
+        self.cache = cache
+
+    def get_path(self, company_id, name, ext='.csv'):
+        company_id = str(company_id)
+        return self.data_dir + company_id + '/' + company_id + '_' + name + ext
+
+    def get_download(self, company_id, name):
+        # Keyword arguments of the FinMind request that fills this dataset
+        schema = SCHEMAS[name]
+        return {
+            'dataset': schema['dataset'],
+            'company_id': str(company_id),
+            'start_date': get_start_date(name),
+            'output_dir': self.get_path(company_id, name),
+            'timeout': schema.get('timeout', TIMEOUT),
+            'key': schema['key'],
+            'overlap': schema.get('overlap', False),
+            'ttl': schema.get('ttl', DEFAULT_TTL),
+        }
+
+    def is_converted(self, company_id, name):
+        if feather is None:
+            return False
+        try:
+            arrow_mtime = os.stat(self.get_path(company_id, name, ARROW_EXT)).st_mtime_ns
+        except OSError:
+            return False
+        try:
+            return arrow_mtime >= os.stat(self.get_path(company_id, get_source(name))).st_mtime_ns
+        except OSError:
+            return True
+
+    def read_arrow(self, company_id, name):
+        if feather is None:
+            return None
+        try:
+            table = feather.read_table(self.get_path(company_id, name, ARROW_EXT), memory_map=True)
+        except (OSError, ValueError):
+            return None
+        # Files written by an older schema or derivation have to be converted again
+        if (table.schema.metadata or {}).get(ARROW_VERSION_KEY) != get_arrow_version(name):
+            return None
+        return table.to_pandas()
+
+    def write_arrow(self, company_id, name, df):
+        if feather is None:
+            return
+        table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[ARROW_VERSION_KEY] = get_arrow_version(name)
+        table = table.replace_schema_metadata(metadata)
+
+        def write(path):
+            feather.write_feather(table, path, compression='uncompressed')
+
+        replace_file(self.get_path(company_id, name, ARROW_EXT), write)
+
+    def convert(self, company_id, name):
+        df = read_csv(self.get_path(company_id, name), name)
+        previous = self.read_arrow(company_id, name)
+        frames = {name: derive_columns(name, df, previous)}
+        self.write_arrow(company_id, name, frames[name])
+
+        for derived_name in get_derived_datasets(name):
+            frames[derived_name] = derive_dataset(derived_name, frames[name], previous,
+                                                  self.read_arrow(company_id, derived_name))
+            self.write_arrow(company_id, derived_name, frames[derived_name])
+        return frames
+
+    def get_version(self, company_id, name):
+        for ext in ('.csv', ARROW_EXT):
+            try:
+                stat = os.stat(self.get_path(company_id, get_source(name), ext))
+            except OSError:
+                continue
+            return ext, stat.st_mtime_ns, stat.st_size
+        return None
+
+    def load(self, company_id, name):
+        if self.cache is None:
+            return self.read(company_id, name)
+
+        key = (str(company_id), name, self.get_version(company_id, name))
+        df = self.cache.get(key)
+        if df is None:
+            df = self.cache.put(key, self.read(company_id, name))
+        return df
+
+    def read(self, company_id, name):
+        start = time.perf_counter()
+        df = self.read_arrow(company_id, name) if self.is_converted(company_id, name) else None
+        if df is None:
+            df = self.convert(company_id, get_source(name))[name]
+        df = set_date_index(df, name)
+        FILE_READ_SECONDS.observe(time.perf_counter() - start, dataset=name)
+        return df
+
+    def convert_company(self, company_id):
+        converted = []
+        for name in SCHEMAS:
+            if os.path.exists(self.get_path(company_id, name)):
+                try:
+                    self.convert(company_id, name)
+                except pd.errors.EmptyDataError:
+                    continue
+                converted.append(name)
+        return converted
+
+    def get_company_ids(self):
+        return sorted(company_id for company_id in os.listdir(self.data_dir)
+                      if os.path.isdir(self.data_dir + company_id) and
+                      any(os.path.exists(self.get_path(company_id, name)) for name in SCHEMAS))
+
+
+def report(store, company_id):
+    # Load time and memory of the raw CSV path used before versus the typed store
+    rows = []
+    for name in SCHEMAS:
+        path = store.get_path(company_id, name)
+        if not os.path.exists(path):
+            continue
+        try:
+            start = time.perf_counter()
+            df_csv = pd.read_csv(path)
+            df_csv.index = pd.to_datetime(df_csv['date'])
+            csv_time = time.perf_counter() - start
+        except pd.errors.EmptyDataError:
+            continue
+
+        store.read(company_id, name)
+        start = time.perf_counter()
+        df = store.read(company_id, name)
+        store_time = time.perf_counter() - start
+
+        rows.append({'dataset': name, 'rows': len(df),
+                     'csv_ms': round(csv_time * 1000, 2), 'store_ms': round(store_time * 1000, 2),
+                     'csv_kb': round(df_csv.memory_usage(deep=True).sum() / 1024, 1),
+                     'store_kb': round(df.memory_usage(deep=True).sum() / 1024, 1)})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'convert'
+    data_store = DataStore(sys.argv[2] if len(sys.argv) > 2 else './Data/')
+    if feather is None:
+        print('pyarrow is not installed, datasets will be read from CSV')
+
+    if command == 'convert':
+        for company in data_store.get_company_ids():
+            print(company + ': ' + ', '.join(data_store.convert_company(company)))
+    elif command == 'report':
+        companies = sys.argv[3:] or data_store.get_company_ids()
+        for company in companies:
+            print(company)
+            print(report(data_store, company).to_string(index=False))
+    else:
+        print('Usage: python datastore.py [convert|report] [Data dir] [company id ...]')
@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+
+
+def derive_revenue(df):
+    # Revenue is reported for the month before its date
+    df['period'] = df['date'].shift(1)
+    df['MoM'] = ((df.revenue / df.revenue.shift(1) - 1) * 100).round(2)
+    df['YoY'] = ((df.revenue / df.revenue.shift(12) - 1) * 100).round(2)
+    return df
+
+
+def derive_investors_buy_sell(df):
+    df['Net'] = df.buy - df.sell
+    return df
+
+
+def derive_margin_trading(df):
+    df['NetMarginTrading'] = df.MarginPurchaseBuy - df.MarginPurchaseSell - df.MarginPurchaseCashRepayment
+    df['NetShortSelling'] = df.ShortSaleSell - df.ShortSaleBuy - df.ShortSaleCashRepayment
+    return df
+
+
+# FinMind investor names by the class they are summed into; Dealer was split into
+# Dealer_self and Dealer_Hedging in 2014
+INVESTOR_CLASSES = {
+    'Foreign_Investor': 'Foreign',
+    'Foreign_Dealer_Self': 'Foreign',
+    'Investment_Trust': 'Investment_Trust',
+    'Dealer': 'Dealer',
+    'Dealer_self': 'Dealer',
+    'Dealer_Hedging': 'Dealer',
+}
+INVESTOR_COLUMNS = ['Foreign', 'Investment_Trust', 'Dealer']
+
+
+def get_investors_net(df):
+    # Net shares bought per date by each investor class, one column per class, and by all
+    # investors in Net
+    net = df.groupby('date', sort=True)['Net'].sum()
+    classes = df['name'].astype(str).map(INVESTOR_CLASSES)
+    flows = df.groupby([df['date'], classes], sort=True)['Net'].sum().unstack(fill_value=0)
+    flows = flows.reindex(index=net.index, columns=INVESTOR_COLUMNS, fill_value=0).astype('int64')
+    flows['Net'] = net
+    flows.insert(0, 'date', flows.index)
+    flows.columns.name = None
+    return flows.reset_index(drop=True)
+
+
+# Margins in percent of Revenue, from the first profit line a company reports
+MARGINS = {
+    'GrossMargin': ['GrossProfit'],
+    'OperatingMargin': ['OperatingIncome'],
+    'NetMargin': ['IncomeAfterTaxes', 'NetIncome'],
+}
+
+
+def shift_quarters(wide, quarters):
+    # Values of `quarters` quarters before each date, aligned by date so missing quarters stay missing
+    return wide.reindex(wide.index - pd.offsets.QuarterEnd(quarters)).set_axis(wide.index)
+
+
+def get_growth(wide, previous):
+    return ((wide / previous - 1) * 100).replace([np.inf, -np.inf], np.nan).round(2)
+
+
+def get_statements(df):
+    # One row per reported quarter and one column per line item, with the ratios of every
+    # line computed on whole columns: margins, QoQ and YoY growth, trailing twelve months
+    lines = df[df['type'] != '-'].pivot_table(index='date', columns='type', values='value', aggfunc='last',
+                                              observed=True)
+    lines.columns = lines.columns.astype(str)
+    lines = lines.sort_index()
+
+    columns = [lines]
+    for margin, profits in MARGINS.items():
+        profit = pd.Series(np.nan, index=lines.index)
+        for line in profits:
+            if line in lines.columns:
+                profit = profit.fillna(lines[line])
+        revenue = lines['Revenue'] if 'Revenue' in lines.columns else np.nan
+        columns.append((profit * 100 / revenue).round(2).rename(margin))
+
+    last_year = shift_quarters(lines, 1) + shift_quarters(lines, 2) + shift_quarters(lines, 3)
+    columns.append(get_growth(lines, shift_quarters(lines, 1)).add_suffix('_QoQ'))
+    columns.append(get_growth(lines, shift_quarters(lines, 4)).add_suffix('_YoY'))
+    columns.append((lines + last_year).add_suffix('_TTM'))
+
+    statements = pd.concat(columns, axis=1)
+    statements.insert(0, 'date', statements.index)
+    return statements.reset_index(drop=True)
+
+
+# Columns added to a dataset and how many earlier rows each new row depends on
+COLUMNS = {
+    'Revenue': (derive_revenue, 12),
+    'Investors_Buy_Sell': (derive_investors_buy_sell, 0),
+    'Margin_Trading': (derive_margin_trading, 0),
+}
+
+# Datasets built from another dataset and how many earlier dates each new date depends
+# on, recomputed from the first appended date onward
+DATASETS = {
+    'Investors_Net': ('Investors_Buy_Sell', get_investors_net, 0),
+    'Statements': ('Financial_Statements', get_statements, 4),
+}
+
+
+# Bumped when the columns derived for a dataset change, so that its stored files are rebuilt
+VERSIONS = {
+    'Investors_Net': 2,
+}
+
+
+def get_derive_version(name):
+    return VERSIONS.get(name, 1)
+
+
+def get_source(name):
+    return DATASETS[name][0] if name in DATASETS else name
+
+
+def get_derived_datasets(name):
+    return [derived_name for derived_name, (source, _, _) in DATASETS.items() if source == name]
+
+
+def get_appended_start(df, previous):
+    # Number of leading rows df shares with the previously stored frame, None if it is not an
+    # append. Datasets synced with `overlap` re-fetch the last stored date, whose rows may have
+    # been added, reordered or changed since, so they are always recomputed. The shared rows
+    # are compared value by value, since a full download may have revised earlier history.
+    if previous is None or len(previous) == 0 or len(previous) > len(df):
+        return None
+    if not set(previous.columns) >= set(df.columns):
+        return None
+    last_date = previous['date'].iloc[-1]
+    start = int((previous['date'] == last_date).to_numpy().argmax())
+    if df['date'].iloc[start] != last_date:
+        return None
+    for column in df.columns:
+        if not pd.Series(previous[column].to_numpy()[:start]).equals(pd.Series(df[column].to_numpy()[:start])):
+            return None
+    return start
+
+
+def derive_columns(name, df, previous=None):
+    if name not in COLUMNS:
+        return df
+    func, lookback = COLUMNS[name]
+
+    start = get_appended_start(df, previous)
+    if start is None:
+        return func(df)
+
+    begin = max(start - lookback, 0)
+    tail = func(df.iloc[begin:].copy())
+    columns = [column for column in tail.columns if column not in df.columns]
+    if not set(columns) <= set(previous.columns):
+        return func(df)
+    for column in columns:
+        df[column] = np.concatenate([previous[column].to_numpy()[:start], tail[column].to_numpy()[start - begin:]])
+    return df
+
+
+def derive_dataset(name, df, previous=None, previous_derived=None):
+    _, func, lookback = DATASETS[name]
+
+    start = get_appended_start(df, previous)
+    if start is None or previous_derived is None or 'date' not in previous_derived.columns:
+        return func(df)
+
+    start_date = df['date'].iloc[start]
+    dates = df['date'].drop_duplicates()
+    earlier = dates[dates < start_date]
+    begin_date = earlier.iloc[max(len(earlier) - lookback, 0)] if lookback and len(earlier) else start_date
+    tail = func(df[df['date'] >= begin_date])
+    if not set(tail.columns) <= set(previous_derived.columns):
+        return func(df)
+    return pd.concat([previous_derived[previous_derived['date'] < start_date],
+                      tail[tail['date'] >= start_date]], ignore_index=True)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Local stand-in for the FinMind v4 data API. It answers from the CSV files under a
+# Data directory so the crawler and prefetch.py can be exercised without network:
+#   python finmind_stub.py --port 8765 --template 2330
+#   python prefetch.py --url http://127.0.0.1:8765/api/v4/data --ids 2330 2303
+
+import argparse
+import json
+import os
+import random
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import pandas as pd
+from datastore import DataStore, SCHEMAS
+
+DATASET_NAMES = {schema['dataset']: name for name, schema in SCHEMAS.items()}
+
+
+def get_response(store, parameter, template=None):
+    name = DATASET_NAMES.get(parameter.get('dataset'))
+    if name is None:
+        return 400, {'msg': 'unknown dataset', 'status': 400}
+
+    company_id = parameter.get('data_id', '')
+    path = store.get_path(company_id, name)
+    if template and not os.path.exists(path):
+        path = store.get_path(template, name)
+    try:
+        df = pd.read_csv(path, dtype={'stock_id': str})
+    except (OSError, ValueError):
+        df = pd.DataFrame()
+
+    if not df.empty:
+        df = df[df['date'] >= parameter.get('start_date', '')]
+        df['stock_id'] = company_id
+    return 200, {'msg': 'success', 'status': 200, 'data': json.loads(df.to_json(orient='records'))}
+
+
+def get_handler(store, template=None, latency=0.0, fail_rate=0.0):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            parameter = {key: value[0] for key, value in parse_qs(urlparse(self.path).query).items()}
+            time.sleep(latency)
+            if random.random() < fail_rate:
+                status, body = 503, {'msg': 'unavailable', 'status': 503}
+            else:
+                status, body = get_response(store, parameter, template)
+
+            content = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve FinMind datasets from local CSV files')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--data-dir', default='./Data/')
+    parser.add_argument('--template', help='company id whose data answers requests for companies without data')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of requests answered with 503')
+    args = parser.parse_args()
+
+    handler = get_handler(DataStore(args.data_dir), args.template, args.latency, args.fail_rate)
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    print('FinMind stand-in on http://' + args.host + ':' + str(args.port) + '/api/v4/data')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
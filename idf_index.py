@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import numpy as np
+from utils import replace_file
+from datastore import DataStore
+from ner_cache import NerCache
+from nlp import get_news, Tokenizer
+
+INDEX_VERSION = 1
+INDEX_DIR = 'Market_IDF/'
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def link_key(link):
+    return int.from_bytes(hashlib.sha1(str(link).encode('utf-8')).digest()[:8], 'little')
+
+
+def save_array(path, array):
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as file:
+            np.save(file, np.ascontiguousarray(array))
+
+    replace_file(path, write)
+
+
+def save_json(path, data):
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='UTF-8') as file:
+            json.dump(data, file, ensure_ascii=False)
+
+    replace_file(path, write)
+
+
+# Market-wide document frequency of the NER keywords, one document per news link.
+# Terms are append-only and meta.json is written last, so a reader that loads while
+# a save is in progress still gets a consistent prefix of the vocabulary and counts.
+class DocumentFrequencyIndex:
+    def __init__(self, directory, signature=''):
+        self.directory = directory
+        self.signature = signature
+        self.n_documents = 0
+        self.vocabulary = {}
+        self.document_frequency = np.zeros(0, dtype=np.int64)
+        self.seen = np.zeros(0, dtype=np.uint64)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, directory, signature=''):
+        index = cls(directory, signature)
+        try:
+            with open(directory + 'meta.json', 'r', encoding='UTF-8') as file:
+                meta = json.load(file)
+            if meta.get('version') != INDEX_VERSION or meta.get('model') != signature:
+                return index
+            with open(directory + 'vocabulary.json', 'r', encoding='UTF-8') as file:
+                terms = json.load(file)[:meta['n_terms']]
+            document_frequency = np.load(directory + 'document_frequency.npy', mmap_mode='r')
+            seen = np.load(directory + 'seen.npy', mmap_mode='r')
+        except (OSError, ValueError, KeyError):
+            return index
+
+        index.n_documents = meta['n_documents']
+        index.vocabulary = {term: i for i, term in enumerate(terms)}
+        index.document_frequency = document_frequency[:meta['n_terms']]
+        index.seen = seen[:meta['n_seen']]
+        return index
+
+    @classmethod
+    def load_cached(cls, directory, signature=''):
+        # Reuse the loaded index until meta.json changes on disk
+        try:
+            mtime = os.stat(directory + 'meta.json').st_mtime_ns
+        except OSError:
+            return None
+        key = (directory, signature)
+        with _loaded_lock:
+            cached = _loaded.get(key)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, cls.load(directory, signature))
+                _loaded[key] = cached
+        return cached[1]
+
+    def update(self, links, documents):
+        with self._lock:
+            keys = np.array([link_key(link) for link in links], dtype=np.uint64)
+            keys, first = np.unique(keys, return_index=True)
+            new = ~np.isin(keys, self.seen)
+            if not new.any():
+                return 0
+
+            documents = list(documents)
+            columns = []
+            for i in first[new]:
+                for term in set(documents[i]):
+                    columns.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+
+            counts = np.bincount(np.array(columns, dtype=np.int64), minlength=len(self.vocabulary))
+            counts[:len(self.document_frequency)] += self.document_frequency
+            self.document_frequency = counts
+            self.seen = np.union1d(self.seen, keys[new])
+            self.n_documents += int(new.sum())
+            return int(new.sum())
+
+    def save(self):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            save_array(self.directory + 'document_frequency.npy', self.document_frequency.astype(np.int64))
+            save_array(self.directory + 'seen.npy', self.seen.astype(np.uint64))
+            save_json(self.directory + 'vocabulary.json', list(self.vocabulary))
+            save_json(self.directory + 'meta.json', {
+                'version': INDEX_VERSION,
+                'model': self.signature,
+                'n_documents': self.n_documents,
+                'n_terms': len(self.vocabulary),
+                'n_seen': len(self.seen),
+            })
+
+    def idf(self, terms):
+        # Under the lock, since update() adds terms to the vocabulary before the counts grow
+        with self._lock:
+            columns = np.array([self.vocabulary.get(term, -1) for term in terms], dtype=np.int64)
+            document_frequency = np.where(columns >= 0, self.document_frequency[np.maximum(columns, 0)], 0)
+            n_documents = self.n_documents
+        return np.log((1 + n_documents) / (1 + document_frequency)) + 1
+
+
+def get_ner_documents(df, tokenizer, ner_cache):
+    entity_lists = ner_cache.get_entities(df, tokenizer)
+    return [tokenizer.clean(tokenizer.get_word_from_ner_dict(entity_list)) for entity_list in entity_lists]
+
+
+def build_market_idf(data_dir, level=3):
+    tokenizer = Tokenizer(level=level, ner_only=True)
+    signature = tokenizer.service.signature
+    index = DocumentFrequencyIndex.load(data_dir + INDEX_DIR, signature)
+    store = DataStore(data_dir)
+
+    for company_id in sorted(os.listdir(data_dir)):
+        dir_ = data_dir + company_id + '/'
+        if not os.path.exists(dir_ + company_id + '_News.csv'):
+            continue
+        try:
+            df = get_news(store.load(company_id, 'News'))
+        except ValueError:
+            continue
+        documents = get_ner_documents(df, tokenizer, NerCache(dir_, company_id, signature))
+        added = index.update(df['link'], documents)
+        print(company_id + ': ' + str(added) + ' new documents')
+
+    index.save()
+    print('Market IDF: ' + str(index.n_documents) + ' documents, ' + str(len(index.vocabulary)) + ' terms')
+    return index
+
+
+if __name__ == '__main__':
+    build_market_idf(sys.argv[1] if len(sys.argv) > 1 else './Data/')
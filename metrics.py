@@ -0,0 +1,211 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# dash and flask are imported by the functions that serve the metrics, so the data
+# tools can record metrics without them
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_metrics = []
+_collectors = []
+_phase = threading.local()
+
+
+def format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(name + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+                          for name, value in pairs) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+# Prometheus text-format metrics kept in process memory, one series per label values.
+# Observing takes a lock and a bisect, cheap enough to leave on in production.
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name, format_labels(self.labelnames, key), value) for key, value in sorted(values.items())]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+
+        samples = []
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else format_value(bound)
+                samples.append((self.name + '_bucket', format_labels(self.labelnames, key, [('le', le)]), cumulative))
+            samples.append((self.name + '_sum', format_labels(self.labelnames, key), total))
+            samples.append((self.name + '_count', format_labels(self.labelnames, key), cumulative))
+        return samples
+
+
+CALLBACK_SECONDS = Histogram('finlookup_callback_seconds', 'Dash callback wall time, serialization included',
+                             ['callback'])
+CALLBACK_BYTES = Histogram('finlookup_callback_response_bytes', 'Serialized Dash callback response size',
+                           ['callback'], BYTES_BUCKETS)
+CALLBACK_ERRORS = Counter('finlookup_callback_errors_total', 'Dash callbacks that raised', ['callback'])
+CONTROLLER_SECONDS = Histogram('finlookup_controller_seconds',
+                               'Controller method wall time, split into reading data and building the result',
+                               ['method', 'phase'])
+FILE_READ_SECONDS = Histogram('finlookup_file_read_seconds', 'Time to read one dataset from disk', ['dataset'])
+
+
+def register_collector(collect):
+    # collect() returns (name, type, documentation, [(labels, value), ...]) tuples at scrape time
+    _collectors.append(collect)
+
+
+def register_cache(name, cache):
+    def collect():
+        stats = cache.stats()
+        labels = {'cache': name}
+        return [
+            ('finlookup_cache_hits_total', 'counter', 'Cache lookups that found a value', [(labels, stats['hits'])]),
+            ('finlookup_cache_misses_total', 'counter', 'Cache lookups that missed', [(labels, stats['misses'])]),
+            ('finlookup_cache_evictions_total', 'counter', 'Values evicted to stay under the size limit',
+             [(labels, stats['evictions'])]),
+            ('finlookup_cache_hit_ratio', 'gauge', 'Hits over lookups since start', [(labels, stats['hit_ratio'])]),
+            ('finlookup_cache_bytes', 'gauge', 'Estimated size of the cached values', [(labels, stats['bytes'])]),
+            ('finlookup_cache_entries', 'gauge', 'Number of cached values', [(labels, stats['entries'])]),
+        ]
+
+    register_collector(collect)
+
+
+@contextmanager
+def reading():
+    # Time spent inside, reading data from files or FinMind, is reported as the 'read'
+    # phase of the running Controller method
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phase.read = getattr(_phase, 'read', 0.0) + time.perf_counter() - start
+
+
+def timed(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        outer_read = getattr(_phase, 'read', 0.0)
+        _phase.read = 0.0
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            read = _phase.read
+            _phase.read = outer_read + read
+            CONTROLLER_SECONDS.observe(read, method=func.__name__, phase='read')
+            CONTROLLER_SECONDS.observe(max(elapsed - read, 0.0), method=func.__name__, phase='build')
+
+    return wrapper
+
+
+def instrument_app(app):
+    # Wraps every registered server callback; call it after the last @app.callback. Dash's
+    # wrapper returns the serialized response, so its length is the payload size. Series are
+    # labelled by the callback's outputs, since several callbacks share a function name.
+    from dash.exceptions import PreventUpdate
+
+    for output, callback in app.callback_map.items():
+        func = callback.get('callback')
+        if func is None or getattr(func, 'instrumented', False):
+            continue
+
+        def wrapper(*args, _func=func, _name=output, **kwargs):
+            start = time.perf_counter()
+            try:
+                response = _func(*args, **kwargs)
+            except PreventUpdate:
+                raise
+            except Exception:
+                CALLBACK_ERRORS.inc(callback=_name)
+                raise
+            finally:
+                CALLBACK_SECONDS.observe(time.perf_counter() - start, callback=_name)
+            CALLBACK_BYTES.observe(len(response), callback=_name)
+            return response
+
+        wrapper.__name__ = func.__name__
+        wrapper.instrumented = True
+        callback['callback'] = wrapper
+
+    app.server.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.append('# HELP ' + metric.name + ' ' + metric.documentation)
+        lines.append('# TYPE ' + metric.name + ' ' + metric.type)
+        for name, labels, value in metric.samples():
+            lines.append(name + labels + ' ' + format_value(value))
+
+    collected = {}
+    for collect in _collectors:
+        for name, type_, documentation, samples in collect():
+            entry = collected.setdefault(name, (type_, documentation, []))
+            entry[2].extend(samples)
+    for name, (type_, documentation, samples) in collected.items():
+        lines.append('# HELP ' + name + ' ' + documentation)
+        lines.append('# TYPE ' + name + ' ' + type_)
+        for labels, value in samples:
+            lines.append(name + format_labels(list(labels), list(labels.values())) + ' ' + format_value(value))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    from flask import Response
+    return Response(render(), mimetype=None, content_type=CONTENT_TYPE)
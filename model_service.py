@@ -0,0 +1,93 @@
+import threading
+import time
+import ckip_transformers
+from ckip_transformers.nlp import CkipWordSegmenter, CkipPosTagger, CkipNerChunker
+from utils import get_rss
+from metrics import register_collector
+
+DRIVERS = {
+    'ws': CkipWordSegmenter,
+    'pos': CkipPosTagger,
+    'ner': CkipNerChunker,
+}
+
+
+# Holds the CKIP drivers for the lifetime of the process. Each driver is built on
+# first use and then shared by every Tokenizer and request. Calling warm_up() before
+# a preloading WSGI server forks (e.g. gunicorn --preload) lets the workers share
+# the loaded weights copy-on-write instead of each loading their own copy.
+class ModelService:
+    def __init__(self, level=3):
+        self.level = level
+        self._drivers = {}
+        self._lock = threading.Lock()
+        self.load_time = {}
+        self.load_memory = {}
+
+    def get(self, name):
+        driver = self._drivers.get(name)
+        if driver is None:
+            with self._lock:
+                driver = self._drivers.get(name)
+                if driver is None:
+                    driver = self._load(name)
+        return driver
+
+    def _load(self, name):
+        rss = get_rss()
+        start = time.perf_counter()
+        driver = DRIVERS[name](level=self.level)
+        self.load_time[name] = time.perf_counter() - start
+        self.load_memory[name] = max(get_rss() - rss, 0)
+        self._drivers[name] = driver
+        return driver
+
+    @property
+    def signature(self):
+        return 'ckip-transformers-' + str(getattr(ckip_transformers, '__version__', '')) + '-level' + str(self.level)
+
+    def is_loaded(self, name):
+        return name in self._drivers
+
+    def warm_up(self, names=('ws', 'pos', 'ner')):
+        for name in names:
+            self.get(name)
+        return self.stats()
+
+    def stats(self):
+        return {
+            'level': self.level,
+            'loaded': sorted(self._drivers),
+            'load_time': dict(self.load_time),
+            'load_memory': dict(self.load_memory),
+            'rss': get_rss(),
+        }
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_model_service(level=3):
+    with _services_lock:
+        if level not in _services:
+            _services[level] = ModelService(level)
+        return _services[level]
+
+
+def collect():
+    # Load time and memory of every loaded CKIP driver, served on /metrics
+    with _services_lock:
+        stats = [service.stats() for service in _services.values()]
+    load_time = [({'level': item['level'], 'driver': name}, seconds)
+                 for item in stats for name, seconds in item['load_time'].items()]
+    load_memory = [({'level': item['level'], 'driver': name}, size)
+                   for item in stats for name, size in item['load_memory'].items()]
+    return [
+        ('finlookup_model_load_seconds', 'gauge', 'Time to load each CKIP driver', load_time),
+        ('finlookup_model_load_bytes', 'gauge', 'Resident memory added by loading each CKIP driver', load_memory),
+        ('finlookup_process_rss_bytes', 'gauge', 'Resident memory of the process', [({}, get_rss())]),
+    ]
+
+
+register_collector(collect)
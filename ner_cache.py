@@ -0,0 +1,58 @@
+import hashlib
+import json
+from utils import replace_file
+
+NER_CACHE_VERSION = 1
+
+
+def title_hash(title):
+    if type(title) != str:
+        return ''
+    return hashlib.sha1(title.encode('utf-8')).hexdigest()
+
+
+class NerCache:
+    # Entities per article, keyed by link and invalidated when the title changes.
+    # The whole cache is dropped when the format version or the model signature
+    # (CKIP version and Tokenizer level) differs from the one that wrote it.
+    def __init__(self, dir_, company_id, signature):
+        self.path = dir_ + str(company_id) + '_News_NER.json'
+        self.signature = signature
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='UTF-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        if data.get('version') != NER_CACHE_VERSION or data.get('model') != self.signature:
+            return {}
+        return data.get('entries', {})
+
+    def save(self):
+        data = {'version': NER_CACHE_VERSION, 'model': self.signature, 'entries': self.entries}
+
+        def write(path):
+            with open(path, 'w', encoding='UTF-8') as file:
+                json.dump(data, file, ensure_ascii=False)
+
+        replace_file(self.path, write)
+
+    def get_entities(self, df, tokenizer, batch_size=256):
+        links = df['link'].tolist()
+        hashes = [title_hash(title) for title in df['title']]
+
+        missing = [i for i, (link, hash_) in enumerate(zip(links, hashes))
+                   if self.entries.get(link, {}).get('hash') != hash_]
+        if missing:
+            titles = [df['title'].iloc[i] for i in missing]
+            for i, entity_list in zip(missing, tokenizer.tokenize_ner_batch(titles, batch_size)):
+                self.entries[links[i]] = {'hash': hashes[i], 'ner': entity_list}
+            self.save()
+
+        entity_lists = []
+        for link in links:
+            entity_list = self.entries[link]['ner']
+            entity_lists.append(None if entity_list is None else [tuple(entity) for entity in entity_list])
+        return entity_lists
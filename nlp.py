@@ -1,13 +1,15 @@
 import re
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-from ckip_transformers.nlp import CkipWordSegmenter, CkipPosTagger, CkipNerChunker
 from plotly.subplots import make_subplots
-from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy.sparse import diags
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+from model_service import get_model_service
 
 
-def get_news(company_id, dir_):
-    df = pd.read_csv(dir_ + company_id + '_News.csv')
+def get_news(df):
     df = df.drop_duplicates(subset=['link'])
     df = df.sort_values(by=['date'], ascending=False)
 
@@ -20,10 +22,16 @@ def get_news(company_id, dir_):
 
 
 class Tokenizer:
-    def __init__(self, level=3):
-        self.ws_driver = CkipWordSegmenter(level=level)
-        self.pos_driver = CkipPosTagger(level=level)
-        self.ner_driver = CkipNerChunker(level=level)
+    def __init__(self, level=3, ner_only=False):
+        self.level = level
+        self.service = get_model_service(level)
+        if ner_only:
+            self.ws_driver = None
+            self.pos_driver = None
+        else:
+            self.ws_driver = self.service.get('ws')
+            self.pos_driver = self.service.get('pos')
+        self.ner_driver = self.service.get('ner')
         self.stopwords = self.get_stopwords()
 
     @staticmethod
@@ -80,6 +88,32 @@ class Tokenizer:
         else:
             return None
 
+    def tokenize_ner_batch(self, contents, batch_size=256):
+        sentence_lists = [content.split("，") if type(content) == str else None for content in contents]
+
+        sentence_index = {}
+        for sentence_list in sentence_lists:
+            for sentence in sentence_list or []:
+                sentence_index.setdefault(sentence, len(sentence_index))
+
+        if sentence_index:
+            entity_sentence_list = self.ner_driver(list(sentence_index), batch_size=batch_size,
+                                                   show_progress=False)
+        else:
+            entity_sentence_list = []
+
+        entity_lists = []
+        for sentence_list in sentence_lists:
+            if sentence_list is None:
+                entity_lists.append(None)
+                continue
+            entity_sentence_set = set()
+            for sentence in sentence_list:
+                entity_sentence_set.update(entity_sentence_list[sentence_index[sentence]])
+            entity_lists.append([(entity.ner, entity.word) for entity in entity_sentence_set])
+
+        return entity_lists
+
     @staticmethod
     def get_word_from_ner_dict(ner_dict):
         if ner_dict:
@@ -88,20 +122,35 @@ class Tokenizer:
             return []
 
 
-def get_tfidf(document, dataframe, max_features=100, max_df=0.5, norm='l1'):
-    tf_model = TfidfVectorizer(token_pattern=r"(?u)\b\w+\b", max_features=max_features,
-                               max_df=max_df, smooth_idf=False, use_idf=False, norm=norm)
-    tf = tf_model.fit_transform(document)
-    df_tf = pd.DataFrame(tf.toarray(), columns=tf_model.get_feature_names(), index=dataframe['date'])
-    df_sum_tf = pd.DataFrame(df_tf.sum(), columns=['TF'])
+def get_feature_names(model):
+    if hasattr(model, 'get_feature_names_out'):
+        return model.get_feature_names_out()
+    return model.get_feature_names()
+
+
+def get_tfidf(document, dataframe, max_features=100, max_df=0.5, norm='l1', idf_index=None):
+    # Count once and derive TF, IDF and TF-IDF from the same sparse matrix. The result
+    # matches fitting TfidfVectorizer(smooth_idf=False) with use_idf=False and True.
+    # With idf_index, IDF comes from the market-wide document frequency instead.
+    count_model = CountVectorizer(token_pattern=r"(?u)\b\w+\b", max_features=max_features, max_df=max_df)
+    counts = count_model.fit_transform(document).astype(np.float64)
+    vocabulary = get_feature_names(count_model)
+
+    if idf_index is not None:
+        idf = idf_index.idf(vocabulary)
+    else:
+        document_frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+        idf = np.log(counts.shape[0] / document_frequency) + 1
+
+    tf = normalize(counts, norm=norm) if norm else counts
+    tfidf = counts @ diags(idf)
+    tfidf = normalize(tfidf, norm=norm) if norm else tfidf.tocsr()
 
-    tfidf_model = TfidfVectorizer(token_pattern=r"(?u)\b\w+\b", max_features=max_features,
-                                  max_df=max_df, smooth_idf=False, use_idf=True, norm=norm)
-    tfidf = tfidf_model.fit_transform(document)
-    df_tfidf = pd.DataFrame(tfidf.toarray(), columns=tfidf_model.get_feature_names(), index=dataframe['date'])
-    df_sum_tfidf = pd.DataFrame(df_tfidf.sum(), columns=['TF-IDF'])
+    df_tf = pd.DataFrame.sparse.from_spmatrix(tf, index=dataframe['date'], columns=vocabulary)
+    df_tfidf = pd.DataFrame.sparse.from_spmatrix(tfidf, index=dataframe['date'], columns=vocabulary)
 
-    df_sum_tfidf = pd.concat([df_sum_tf, df_sum_tfidf], axis=1)
+    df_sum_tfidf = pd.DataFrame({'TF': np.asarray(tf.sum(axis=0)).ravel(),
+                                 'TF-IDF': np.asarray(tfidf.sum(axis=0)).ravel()}, index=vocabulary)
     df_sum_tfidf['IDF'] = df_sum_tfidf['TF-IDF'] / df_sum_tfidf['TF']
     df_sum_tfidf = df_sum_tfidf[['TF', 'IDF', 'TF-IDF']]
     df_sum_tfidf = df_sum_tfidf.sort_values(by='TF-IDF', ascending=False)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import utils
+from utils import create_folder, get_data_from_finmind, sync_data_from_finmind, TokenBucket
+from datastore import DataStore, SCHEMAS
+from company_index import get_stock_dict
+
+JOURNAL = 'prefetch_journal.jsonl'
+
+
+def get_company_ids(watchlist=None):
+    if watchlist:
+        with open(watchlist, 'r', encoding='UTF-8') as file:
+            return [line.strip() for line in file if line.strip() and not line.startswith('#')]
+    tw_dict, _ = get_stock_dict()
+    return [str(company_id) for company_id in tw_dict]
+
+
+def read_journal(path):
+    # (company_id, dataset) pairs that finished without error in an earlier run
+    done = set()
+    try:
+        with open(path, 'r', encoding='UTF-8') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if not entry.get('error'):
+                    done.add((entry['company_id'], entry['dataset']))
+    except OSError:
+        pass
+    return done
+
+
+class Prefetcher:
+    def __init__(self, data_dir, token, workers=4, rate=2.0, burst=4, full=False, journal=None):
+        self.store = DataStore(data_dir)
+        self.token = token
+        self.workers = workers
+        self.limiter = TokenBucket(rate, burst)
+        self.full = full
+        self.journal = journal or data_dir + JOURNAL
+        self.failures = []
+        self._lock = threading.Lock()
+
+    def fetch(self, company_id, name):
+        create_folder(self.store.data_dir + company_id)
+        func = get_data_from_finmind if self.full else sync_data_from_finmind
+        start = time.perf_counter()
+        error = func(token=self.token, limiter=self.limiter, **self.store.get_download(company_id, name))
+        entry = {'company_id': company_id, 'dataset': name, 'error': error,
+                 'seconds': round(time.perf_counter() - start, 3), 'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+        with self._lock:
+            with open(self.journal, 'a', encoding='UTF-8') as file:
+                file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            if error:
+                self.failures.append(entry)
+        return error
+
+    def run(self, company_ids, names, resume=True):
+        done = read_journal(self.journal) if resume else set()
+        tasks = [(company_id, name) for company_id in company_ids for name in names
+                 if (company_id, name) not in done]
+        print('Prefetching ' + str(len(tasks)) + ' datasets (' + str(len(done)) + ' already done) with ' +
+              str(self.workers) + ' workers at ' + str(self.limiter.rate) + ' requests/s')
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(lambda task: self.fetch(*task), tasks))
+        elapsed = time.perf_counter() - start
+
+        report = {
+            'datasets': len(tasks),
+            'failed': len(self.failures),
+            'seconds': round(elapsed, 2),
+            'datasets_per_second': round(len(tasks) / elapsed, 2) if elapsed else 0.0,
+        }
+        print('Done: ' + json.dumps(report))
+        for failure in self.failures:
+            print('Failed: ' + failure['company_id'] + ' ' + failure['dataset'] + ' (' + failure['error'] + ')')
+
+        # The journal only checkpoints an unfinished run; the next run after a complete one syncs everything again
+        if not self.failures:
+            try:
+                os.remove(self.journal)
+            except OSError:
+                pass
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download FinMind datasets for every company in StockTable.json')
+    parser.add_argument('--data-dir', default='./Data/')
+    parser.add_argument('--token', default='')
+    parser.add_argument('--watchlist', help='file with one company id per line, instead of every listed company')
+    parser.add_argument('--ids', nargs='*', help='company ids, instead of every listed company')
+    parser.add_argument('--datasets', nargs='*', choices=list(SCHEMAS), default=list(SCHEMAS))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=2.0, help='requests per second')
+    parser.add_argument('--burst', type=int, default=4)
+    parser.add_argument('--full', action='store_true', help='download the full history instead of syncing')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint journal')
+    parser.add_argument('--url', help='FinMind API url, e.g. a local stand-in')
+    parser.add_argument('--record', metavar='DIR', help='save every FinMind response under DIR')
+    parser.add_argument('--replay', metavar='DIR', help='answer from the responses saved under DIR, without network')
+    args = parser.parse_args()
+
+    if args.url:
+        utils.FINMIND_URL = args.url
+    if args.record or args.replay:
+        utils.FETCH_MODE = 'record' if args.record else 'replay'
+        utils.RECORD_DIR = os.path.join(args.record or args.replay, '')
+    utils.MAX_WORKERS = max(utils.MAX_WORKERS, args.workers)
+    data_dir = os.path.join(args.data_dir, '')
+
+    journal = data_dir + JOURNAL
+    if args.restart and os.path.exists(journal):
+        os.remove(journal)
+
+    company_ids = args.ids or get_company_ids(args.watchlist)
+    prefetcher = Prefetcher(data_dir, args.token, args.workers, args.rate, args.burst, args.full, journal)
+    prefetcher.run(company_ids, args.datasets)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import pandas as pd
+
+# Datasets whose window is widened when the selected range is short: below min_days
+# the window starts on January 1st, `years` years before the end date
+WIDENING = {
+    'Revenue': (365, 1),
+    'Financial_Statements': (5 * 365, 5),
+    'Statements': (5 * 365, 5),
+    'Shareholding': (5 * 365, 5),
+}
+
+
+def to_time_series(df, unique=True):
+    # Sorted DatetimeIndex without missing dates, deduplicated (last row wins) when unique
+    if df.index.hasnans:
+        df = df[df.index.notna()]
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index(kind='mergesort')
+    if unique and not df.index.is_unique:
+        df = df[~df.index.duplicated(keep='last')]
+    return df
+
+
+def get_date_range(start_date, end_date, name=None):
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    if name in WIDENING:
+        min_days, years = WIDENING[name]
+        if start >= end - pd.Timedelta(days=min_days):
+            start = pd.Timestamp(year=end.year - years, month=1, day=1)
+    return start, end
+
+
+def slice_range(df, start, end):
+    # Rows with start <= date <= end by binary search on the sorted index, as a positional slice
+    left = df.index.searchsorted(pd.Timestamp(start), side='left')
+    right = df.index.searchsorted(pd.Timestamp(end), side='right')
+    return df.iloc[left:right]
+
+
+def query(df, start_date, end_date, name=None):
+    # No range selects the whole history
+    if start_date is None and end_date is None:
+        return df
+    return slice_range(df, *get_date_range(start_date, end_date, name))
+
+
+def rolling_sum(df, start_date, end_date, window):
+    # Sums over the last `window` rows at every row of the range; the rows before the range
+    # are read as well so its first values cover a full window
+    if start_date is None and end_date is None:
+        return df.rolling(window, min_periods=1).sum()
+    start, end = get_date_range(start_date, end_date)
+    left = max(df.index.searchsorted(start, side='left') - window + 1, 0)
+    right = df.index.searchsorted(end, side='right')
+    return slice_range(df.iloc[left:right].rolling(window, min_periods=1).sum(), start, end)
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+# Bar period by window length: daily bars up to a year, weekly up to five years, then monthly
+FREQUENCIES = [
+    (366, None),
+    (5 * 366, 'W'),
+    (None, 'M'),
+]
+
+OHLC = {'open': 'first', 'max': 'max', 'min': 'min', 'close': 'last', 'Trading_Volume': 'sum'}
+
+
+def get_frequency(start_date, end_date):
+    if start_date is None or end_date is None:
+        return None
+    days = (pd.Timestamp(end_date).to_pydatetime() - pd.Timestamp(start_date).to_pydatetime()).days
+    for max_days, freq in FREQUENCIES:
+        if max_days is None or days <= max_days:
+            return freq
+
+
+def resample(df, freq, how):
+    # Aggregate rows per calendar period, labelled by the period's first day so that
+    # every dataset resampled with the same freq shares its x values
+    if freq is None or df.empty:
+        return df
+    periods = df.index.to_period(freq)
+    resampled = df[list(how)].groupby(periods, sort=True).agg(how)
+    resampled.index = resampled.index.start_time
+    return resampled
+
+
+def resample_ohlc(df, freq):
+    return resample(df, freq, {column: how for column, how in OHLC.items() if column in df.columns})
+
+
+def resample_sum(df, freq, columns):
+    return resample(df, freq, {column: 'sum' for column in columns})
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: positions of n_out points that keep the visual shape
+    # of the line, always including the first and the last point
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_start, next_stop = (edges[i + 1], edges[i + 2]) if i < n_out - 3 else (n - 1, n)
+        average_x = x[next_start:next_stop].mean()
+        average_y = y[next_start:next_stop].mean()
+        area = np.abs((x[a] - average_x) * (y[start:stop] - y[a]) -
+                      (x[a] - x[start:stop]) * (average_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_line(df, column, max_points):
+    # Rows of a time series kept when its line trace is drawn with at most max_points points
+    if not max_points or len(df) <= max_points:
+        return df
+    values = df[column].to_numpy(dtype=np.float64)
+    if np.isnan(values).any():
+        return df
+    return df.iloc[lttb(df.index.asi8, values, max_points)]
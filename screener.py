@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Market-wide screener over every company under Data/. The latest valuation, earnings
+# and revenue figures of each company are kept in one panel, a row per company, which
+# is rebuilt only for companies whose source files changed since the last update:
+#   python screener.py [--data-dir ./Data/] [--workers 4] [--full]
+# The dashboard then keeps the row of every company it syncs up to date.
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+import numpy as np
+import pandas as pd
+from utils import replace_file
+from datastore import DataStore
+
+PANEL_FILE = 'Market_Panel.csv'
+SCREEN_LIMIT = 50
+MAX_LIMIT = 5000
+
+# Latest non-missing value of each column, by the dataset it is read from
+LATEST_COLUMNS = {
+    'Price': {'close': 'close'},
+    'PER': {'PER': 'PER', 'PBR': 'PBR', 'dividend_yield': 'dividend_yield'},
+    'Statements': {'EPS': 'EPS', 'EPS_TTM': 'EPS_TTM', 'GrossMargin': 'GrossMargin'},
+    'Revenue': {'YoY': 'YoY', 'MoM': 'MoM'},
+}
+# Source files whose size and mtime decide whether a company's row is rebuilt
+SOURCES = ['Price', 'PER', 'Financial_Statements', 'Revenue']
+
+SCREEN_COLUMNS = [column for columns in LATEST_COLUMNS.values() for column in columns.values()]
+PANEL_COLUMNS = ['stock_id', 'date'] + SCREEN_COLUMNS + ['source']
+
+OPERATORS = {
+    '<=': np.less_equal,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '>': np.greater,
+    '=': np.equal,
+}
+FILTER_PATTERN = re.compile(r'^([A-Za-z_]+)(<=|>=|<|>|=)(-?[0-9.]+)$')
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+_updates = None
+_pending = set()
+_updates_lock = threading.Lock()
+
+
+def get_panel_path(data_dir):
+    return data_dir + PANEL_FILE
+
+
+def get_source_signature(store, company_id):
+    signature = []
+    for name in SOURCES:
+        try:
+            stat = os.stat(store.get_path(company_id, name))
+            signature.append(str(stat.st_mtime_ns) + ':' + str(stat.st_size))
+        except OSError:
+            signature.append('-')
+    return ','.join(signature)
+
+
+def get_company_row(data_dir, company_id, source):
+    # Runs in a worker process; datasets that are missing or empty leave their columns empty
+    store = DataStore(data_dir)
+    row = {'stock_id': company_id, 'date': None, 'source': source}
+    for name, columns in LATEST_COLUMNS.items():
+        try:
+            df = store.read(company_id, name)
+        except (OSError, ValueError):
+            continue
+        for column, screen_column in columns.items():
+            values = df[column].dropna() if column in df.columns else ()
+            row[screen_column] = float(values.iloc[-1]) if len(values) else None
+        if name == 'Price' and len(df):
+            row['date'] = df.index[-1].strftime('%Y-%m-%d')
+    return row
+
+
+def load_panel(data_dir):
+    try:
+        panel = pd.read_csv(get_panel_path(data_dir), dtype={'stock_id': str, 'date': str, 'source': str})
+    except (OSError, ValueError):
+        return pd.DataFrame(columns=PANEL_COLUMNS)
+    return panel.reindex(columns=PANEL_COLUMNS)
+
+
+def save_panel(data_dir, panel):
+    def write(path):
+        panel.to_csv(path, index=False)
+
+    replace_file(get_panel_path(data_dir), write)
+
+
+def update_panel(data_dir, workers=None, full=False):
+    # Rows of unchanged companies are kept; the others are rebuilt across a process pool
+    store = DataStore(data_dir)
+    company_ids = store.get_company_ids()
+    sources = pd.Series({company_id: get_source_signature(store, company_id) for company_id in company_ids},
+                        dtype=object)
+
+    panel = load_panel(data_dir)
+    if full:
+        panel = panel.iloc[0:0]
+    kept = panel[panel['stock_id'].map(sources).eq(panel['source']).to_numpy()]
+    changed = [company_id for company_id in company_ids if company_id not in set(kept['stock_id'])]
+
+    start = time.perf_counter()
+    rows = []
+    if changed:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rows = list(executor.map(get_company_row, repeat(data_dir), changed,
+                                     [sources[company_id] for company_id in changed],
+                                     chunksize=max(len(changed) // (4 * workers), 1)))
+
+    panel = pd.concat([kept, pd.DataFrame(rows, columns=PANEL_COLUMNS)], ignore_index=True)
+    panel = panel.sort_values('stock_id', kind='mergesort').reset_index(drop=True)
+    save_panel(data_dir, panel)
+    return {'companies': len(panel), 'rebuilt': len(changed), 'seconds': round(time.perf_counter() - start, 3)}
+
+
+def has_panel(data_dir):
+    return os.path.exists(get_panel_path(data_dir))
+
+
+def update_company(data_dir, company_id):
+    # Rebuilds one company's row when its source files changed. Only an existing panel is
+    # updated, so a panel is never started with just the companies that were browsed.
+    company_id = str(company_id)
+    if not has_panel(data_dir):
+        return False
+    source = get_source_signature(DataStore(data_dir), company_id)
+    panel = get_screener(data_dir).panel
+    if (panel.loc[panel['stock_id'] == company_id, 'source'] == source).any():
+        return False
+
+    row = pd.DataFrame([get_company_row(data_dir, company_id, source)], columns=PANEL_COLUMNS)
+    panel = load_panel(data_dir)
+    panel = pd.concat([panel[panel['stock_id'] != company_id], row], ignore_index=True)
+    panel = panel.sort_values('stock_id', kind='mergesort').reset_index(drop=True)
+    save_panel(data_dir, panel)
+    return True
+
+
+def run_update(key):
+    with _updates_lock:
+        _pending.discard(key)
+    try:
+        update_company(*key)
+    except (OSError, ValueError):
+        pass
+
+
+def schedule_update(data_dir, company_id):
+    # update_company in a background thread. Updates run one at a time, so rows written by
+    # this process are not lost; another process writing at the same moment can still win,
+    # until its company is updated again or the CLI runs.
+    global _updates
+    key = (data_dir, str(company_id))
+    with _updates_lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+        if _updates is None:
+            _updates = ThreadPoolExecutor(max_workers=1)
+    _updates.submit(run_update, key)
+
+
+def parse_filters(text):
+    # "PER<15 YoY>=20, dividend_yield>4" into [(column, operator, value), ...]
+    filters = []
+    for term in re.split(r'[\s,]+', str(text or '').strip()):
+        if not term:
+            continue
+        match = FILTER_PATTERN.match(term)
+        if match is None or match.group(1) not in SCREEN_COLUMNS:
+            raise ValueError('Invalid filter: ' + term)
+        try:
+            filters.append((match.group(1), match.group(2), float(match.group(3))))
+        except ValueError:
+            raise ValueError('Invalid filter: ' + term)
+    return filters
+
+
+# The panel held as one float array per column, so a query is a few vectorized
+# comparisons and a sort of the matching rows, however many companies there are
+class Screener:
+    def __init__(self, panel):
+        self.panel = panel.reset_index(drop=True)
+        self.values = {column: self.panel[column].to_numpy(dtype=np.float64) for column in SCREEN_COLUMNS}
+
+    def query(self, filters=(), sort_by='stock_id', ascending=True, limit=SCREEN_LIMIT):
+        # Matching rows sorted by sort_by, companies without a value last, and the number of matches
+        mask = np.ones(len(self.panel), dtype=bool)
+        with np.errstate(invalid='ignore'):
+            for column, operator, value in filters:
+                mask &= OPERATORS[operator](self.values[column], value)
+        positions = np.flatnonzero(mask)
+
+        if sort_by in self.values:
+            keys = self.values[sort_by][positions]
+            order = np.argsort(keys if ascending else -keys, kind='mergesort')
+            positions = positions[order]
+        elif sort_by == 'stock_id' and not ascending:
+            positions = positions[::-1]
+        return self.panel.iloc[positions[:limit]], len(positions)
+
+
+def get_screener(data_dir):
+    # Reuse the loaded panel until its file changes on disk
+    path = get_panel_path(data_dir)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    with _loaded_lock:
+        cached = _loaded.get(data_dir)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, Screener(load_panel(data_dir)))
+            _loaded[data_dir] = cached
+    return cached[1]
+
+
+def screen(data_dir, text='', sort_by='stock_id', ascending=True, limit=SCREEN_LIMIT):
+    if sort_by not in SCREEN_COLUMNS and sort_by != 'stock_id':
+        raise ValueError('Invalid sort column: ' + str(sort_by))
+    rows, count = get_screener(data_dir).query(parse_filters(text), sort_by, ascending, limit)
+    return rows[['stock_id', 'date'] + SCREEN_COLUMNS], count
+
+
+def add_screener_api(server, data_dir):
+    # GET /api/screener?filter=PER<15 YoY>20&sort=dividend_yield&order=desc&limit=50
+    from flask import request, Response
+
+    def screener_view():
+        args = request.args
+        try:
+            limit = max(min(int(args.get('limit', SCREEN_LIMIT)), MAX_LIMIT), 0)
+            rows, count = screen(data_dir, args.get('filter', ''), args.get('sort', 'stock_id'),
+                                 args.get('order', 'asc') != 'desc', limit)
+        except ValueError as error:
+            return Response(json.dumps({'error': str(error)}), status=400, mimetype='application/json')
+        body = {'count': count, 'columns': list(rows.columns),
+                'rows': json.loads(rows.to_json(orient='values', double_precision=4))}
+        return Response(json.dumps(body, ensure_ascii=False), mimetype='application/json')
+
+    server.add_url_rule('/api/screener', 'screener', screener_view)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or update the market-wide screener panel')
+    parser.add_argument('--data-dir', default='./Data/')
+    parser.add_argument('--workers', type=int, help='worker processes, one per CPU by default')
+    parser.add_argument('--full', action='store_true', help='rebuild every company')
+    args = parser.parse_args()
+
+    data_dir = os.path.join(args.data_dir, '')
+    report = update_panel(data_dir, args.workers, args.full)
+    print(json.dumps(report))
+    print('Panel written to ' + get_panel_path(data_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Cold start report of the dashboard: a fresh interpreter imports FinLookup, serves the
+# page and answers the first price callback. Heavy modules that are only needed by the
+# NLP Analysis must not be loaded by then. With a baseline saved by --save, slower import
+# or first response, or more memory than the baseline allows, is reported as a regression:
+#   python startup.py --save
+#   python startup.py
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BASELINE = 'startup_baseline.json'
+TOLERANCE = 0.25
+
+# Modules of the NLP and imaging stack, imported by the first NLP Analysis
+LAZY_MODULES = ['torch', 'transformers', 'ckip_transformers', 'sklearn', 'wordcloud', 'matplotlib', 'nlp',
+                'model_service', 'idf_index', 'word_cloud']
+
+
+def post_callback(client, dependency, values):
+    def ids(spec):
+        return [{'id': item.split('.')[0], 'property': item.split('.')[1]} for item in spec.strip('.').split('...')]
+
+    inputs = [dict(item, value=values.get(item['id'] + '.' + item['property'])) for item in dependency['inputs']]
+    body = {
+        'output': dependency['output'],
+        'outputs': ids(dependency['output']) if dependency['output'].startswith('..') else ids(dependency['output'])[0],
+        'inputs': inputs,
+        'state': [dict(item, value=None) for item in dependency['state']],
+        'changedPropIds': [inputs[-1]['id'] + '.' + inputs[-1]['property']],
+    }
+    return client.post('/_dash-update-component', json=body)
+
+
+def measure(company_id):
+    start = time.perf_counter()
+    import FinLookup
+    from utils import get_rss
+    import_seconds = time.perf_counter() - start
+
+    client = FinLookup.app.server.test_client()
+    page_bytes = len(client.get('/').data) + len(client.get('/_dash-layout').data)
+    dependencies = json.loads(client.get('/_dash-dependencies').data)
+    layout = FinLookup.app.layout
+    time_slider = layout['Time-Slider']
+    values = {
+        'Time-Slider.start_date': str(time_slider.start_date),
+        'Time-Slider.end_date': str(time_slider.end_date),
+        'Company-ID.data': str(company_id),
+    }
+    dependency = next(dependency for dependency in dependencies if 'Latest-Price.children' in dependency['output'])
+    response = post_callback(client, dependency, values)
+    first_response_seconds = time.perf_counter() - start
+
+    return {
+        'import_seconds': round(import_seconds, 3),
+        'first_response_seconds': round(first_response_seconds, 3),
+        'first_response_status': response.status_code,
+        'page_bytes': page_bytes,
+        'rss_mb': round(get_rss() / 1024 ** 2, 1),
+        'lazy_modules_loaded': [name for name in LAZY_MODULES if name in sys.modules],
+    }
+
+
+def run_cold(company_id):
+    # Every measurement runs in a new interpreter so nothing is imported or cached yet
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--company-id', company_id],
+                            stdout=subprocess.PIPE, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    report = json.loads(output.stdout.decode('utf-8').strip().splitlines()[-1])
+    report['process_seconds'] = round(time.perf_counter() - start, 3)
+    return report
+
+
+def get_regressions(report, baseline, tolerance=TOLERANCE):
+    regressions = []
+    if report['lazy_modules_loaded']:
+        regressions.append('loaded at startup: ' + ', '.join(report['lazy_modules_loaded']))
+    if report['first_response_status'] != 200:
+        regressions.append('first response status ' + str(report['first_response_status']))
+    for key in ('import_seconds', 'first_response_seconds', 'rss_mb', 'page_bytes'):
+        if baseline and key in baseline and report[key] > baseline[key] * (1 + tolerance):
+            regressions.append(key + ' ' + str(report[key]) + ' > ' + str(baseline[key]) + ' baseline')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report the cold start of the dashboard')
+    parser.add_argument('--company-id', default='2330')
+    parser.add_argument('--repeat', type=int, default=3, help='cold starts, the fastest is reported')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='save this report as the baseline')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.company_id)))
+        return
+
+    reports = [run_cold(args.company_id) for _ in range(args.repeat)]
+    report = min(reports, key=lambda item: item['first_response_seconds'])
+    print(json.dumps(report))
+
+    if args.save:
+        with open(args.baseline, 'w', encoding='UTF-8') as file:
+            json.dump(report, file, indent=2)
+        print('Saved baseline to ' + args.baseline)
+        return
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='UTF-8') as file:
+            baseline = json.load(file)
+    regressions = get_regressions(report, baseline, args.tolerance)
+    for regression in regressions:
+        print('Regression: ' + regression)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
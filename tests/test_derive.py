@@ -0,0 +1,115 @@
+import pandas as pd
+import pytest
+import datastore
+import utils
+from datastore import DataStore
+from derive import derive_columns, derive_dataset
+from utils import sync_data_from_finmind
+
+NAMES = ['Foreign_Investor', 'Investment_Trust', 'Dealer_self']
+START_DATE = '2021-01-01'
+
+
+def make_investors(days):
+    # Investors_Buy_Sell rows, days is {date: [(name, buy, sell), ...]}
+    rows = [{'date': day, 'stock_id': '2330', 'buy': buy, 'name': name, 'sell': sell}
+            for day, investors in days.items() for name, buy, sell in investors]
+    return pd.DataFrame(rows, columns=['date', 'stock_id', 'buy', 'name', 'sell'])
+
+
+@pytest.fixture
+def finmind(monkeypatch):
+    # Serves `remote` like FinMind, the rows from the requested start date on, and keeps the requests
+    server = {'remote': None, 'requests': []}
+
+    def fetch_finmind(parameter, timeout=utils.TIMEOUT, limiter=None, ttl=0):
+        server['requests'].append(dict(parameter))
+        remote = server['remote']
+        return {'data': remote[remote['date'] >= parameter['start_date']].to_dict('records')}
+
+    monkeypatch.setattr(utils, 'fetch_finmind', fetch_finmind)
+    return server
+
+
+def sync(tmp_path, name, start_date=START_DATE, company_id='2330'):
+    download = DataStore(str(tmp_path) + '/').get_download(company_id, name)
+    download['start_date'] = start_date
+    return sync_data_from_finmind(token='', **download)
+
+
+def write_stored(tmp_path, name, df, company_id='2330'):
+    (tmp_path / company_id).mkdir(exist_ok=True)
+    df.to_csv(tmp_path / company_id / (company_id + '_' + name + '.csv'), index=False)
+
+
+def read_stored(tmp_path, name, company_id='2330'):
+    return pd.read_csv(tmp_path / company_id / (company_id + '_' + name + '.csv'), dtype={'stock_id': str})
+
+
+def rebuild(csv):
+    df = datastore.apply_schema(csv.copy(), 'Investors_Buy_Sell')
+    df = derive_columns('Investors_Buy_Sell', df)
+    return df, derive_dataset('Investors_Net', df)
+
+
+@pytest.fixture
+def stored():
+    return make_investors({
+        '2021-04-07': [(name, 100 * (i + 1), 50) for i, name in enumerate(NAMES)],
+        '2021-04-08': [(name, 200 * (i + 1), 80) for i, name in enumerate(NAMES)],
+    })
+
+
+@pytest.mark.parametrize('refetched', [
+    # A late row for an investor that was not reported yet
+    [('Foreign_Dealer_Self', 70, 10)] + [(name, 200 * (i + 1), 80) for i, name in enumerate(NAMES)],
+    # The same investors in another order
+    [(name, 200 * (i + 1), 80) for i, name in reversed(list(enumerate(NAMES)))],
+    # Only the values changed
+    [(name, 300 * (i + 1), 90) for i, name in enumerate(NAMES)],
+])
+def test_overlapping_sync_matches_rebuild(tmp_path, finmind, stored, refetched):
+    if datastore.feather is None:
+        pytest.skip('pyarrow is not installed')
+    write_stored(tmp_path, 'Investors_Buy_Sell', stored)
+    DataStore(str(tmp_path) + '/').convert('2330', 'Investors_Buy_Sell')
+
+    new_day = [(name, 10 * (i + 1), 5) for i, name in enumerate(NAMES)]
+    finmind['remote'] = pd.concat([stored[stored['date'] < '2021-04-08'],
+                                   make_investors({'2021-04-08': refetched, '2021-04-09': new_day})],
+                                  ignore_index=True)
+    assert sync(tmp_path, 'Investors_Buy_Sell') == ''
+    # Overlap re-fetches the last stored date
+    assert finmind['requests'][-1]['start_date'] == '2021-04-08'
+
+    synced = read_stored(tmp_path, 'Investors_Buy_Sell')
+    assert sorted(map(tuple, synced.values.tolist())) == sorted(map(tuple, finmind['remote'].values.tolist()))
+
+    frames = DataStore(str(tmp_path) + '/').convert('2330', 'Investors_Buy_Sell')
+    expected, expected_net = rebuild(synced)
+    pd.testing.assert_frame_equal(frames['Investors_Buy_Sell'].reset_index(drop=True),
+                                  expected.reset_index(drop=True), check_categorical=False)
+    pd.testing.assert_frame_equal(frames['Investors_Net'].reset_index(drop=True),
+                                  expected_net.reset_index(drop=True))
+
+
+def test_sync_drops_rows_before_start_date(tmp_path, finmind):
+    news = pd.DataFrame({'date': ['2021-03-01 09:00:00', '2021-04-08 09:00:00', '2021-04-09 10:00:00'],
+                         'stock_id': '2330', 'link': ['a', 'b', 'c'], 'source': 'x', 'title': ['A', 'B', 'C']})
+    write_stored(tmp_path, 'News', news.iloc[:2])
+    finmind['remote'] = news
+
+    assert sync(tmp_path, 'News', start_date='2021-03-20') == ''
+    assert read_stored(tmp_path, 'News')['link'].tolist() == ['b', 'c']
+
+
+def test_sync_downloads_everything_when_columns_change(tmp_path, finmind, stored):
+    write_stored(tmp_path, 'Investors_Buy_Sell', stored)
+    remote = make_investors({'2021-04-09': [(name, 1, 1) for name in NAMES]})
+    finmind['remote'] = pd.concat([stored, remote], ignore_index=True).assign(note='')
+
+    assert sync(tmp_path, 'Investors_Buy_Sell') == ''
+    assert finmind['requests'][-1]['start_date'] == START_DATE
+    synced = read_stored(tmp_path, 'Investors_Buy_Sell')
+    assert list(synced.columns) == list(finmind['remote'].columns)
+    assert len(synced) == len(finmind['remote'])
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Dashboard throughput with 1 and N concurrent workers. Every request renders what a
+# company switch renders (the six Company-ID callbacks) for a random date range and
+# serializes the responses like Dash does, e.g.
+#   python throughput.py --workers 1 2 4 --mode thread process --requests 40
+# With --switch it instead times one company switch end to end, the six callbacks
+# fired together as the threaded server runs them, with cold and warm caches.
+
+import argparse
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import date, timedelta
+from plotly.utils import PlotlyJSONEncoder
+from controller import Controller, data_cache
+
+DASHBOARD_CALLS = [
+    ('update_news', False),
+    ('update_price_figure', True),
+    ('update_revenue_figure', True),
+    ('update_financial_statements_figure', True),
+    ('update_per_ratio', False),
+    ('update_shareholding', True),
+]
+
+
+def render_callback(data_dir, company_id, method, args):
+    controller = Controller(data_dir, '', company_id)
+    return len(json.dumps(getattr(controller, method)(*args), cls=PlotlyJSONEncoder))
+
+
+def render_dashboard(data_dir, company_id, start_date, end_date):
+    size = 0
+    for method, ranged in DASHBOARD_CALLS:
+        args = (start_date, end_date) if ranged else ()
+        size += render_callback(data_dir, company_id, method, args)
+    return size
+
+
+def measure_switch(data_dir, company_id, start_date, end_date, repeat=5):
+    def switch():
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(DASHBOARD_CALLS)) as executor:
+            futures = [executor.submit(render_callback, data_dir, company_id, method,
+                                       (start_date, end_date) if ranged else ())
+                       for method, ranged in DASHBOARD_CALLS]
+            size = sum(future.result() for future in futures)
+        return time.perf_counter() - start, size
+
+    cold = []
+    for _ in range(repeat):
+        data_cache.clear()
+        cold.append(switch()[0])
+    warm = [switch()[0] for _ in range(repeat)]
+    return {'company_id': company_id, 'cold_seconds': round(min(cold), 3), 'warm_seconds': round(min(warm), 3),
+            'bytes': switch()[1]}
+
+
+def get_requests(company_ids, n, end_date, seed=0):
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(n):
+        end = end_date - timedelta(days=rng.randint(0, 365))
+        start = end - timedelta(days=rng.choice([30, 90, 365, 3 * 365]))
+        requests.append((rng.choice(company_ids), start.isoformat(), end.isoformat()))
+    return requests
+
+
+def measure(data_dir, requests, workers, mode):
+    executor_class = ProcessPoolExecutor if mode == 'process' else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        # Warm every worker so the comparison is not dominated by start-up and first loads
+        list(executor.map(render_dashboard, *zip(*[(data_dir,) + request for request in requests[:workers]])))
+
+        start = time.perf_counter()
+        futures = [executor.submit(render_dashboard, data_dir, *request) for request in requests]
+        failed = 0
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                failed += 1
+        elapsed = time.perf_counter() - start
+    return {'mode': mode, 'workers': workers, 'requests': len(requests), 'failed': failed,
+            'seconds': round(elapsed, 3), 'requests_per_second': round(len(requests) / elapsed, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare dashboard throughput between 1 and N workers')
+    parser.add_argument('--data-dir', default='./Data/')
+    parser.add_argument('--ids', nargs='*', default=['2330'])
+    parser.add_argument('--workers', nargs='*', type=int, default=[1, 4])
+    parser.add_argument('--mode', nargs='*', choices=['thread', 'process'], default=['thread', 'process'])
+    parser.add_argument('--requests', type=int, default=40)
+    parser.add_argument('--end-date', default='2021-04-09')
+    parser.add_argument('--switch', action='store_true', help='time a company switch instead of throughput')
+    args = parser.parse_args()
+
+    if args.switch:
+        end_date = date.fromisoformat(args.end_date)
+        start_date = (end_date - timedelta(days=365)).isoformat()
+        for company_id in args.ids:
+            print(json.dumps(measure_switch(args.data_dir, company_id, start_date, end_date.isoformat())))
+        return
+
+    requests = get_requests(args.ids, args.requests, date.fromisoformat(args.end_date))
+    results = [measure(args.data_dir, requests, workers, mode) for mode in args.mode for workers in args.workers]
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,33 @@
+import json
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import timedelta
 import requests
 import pandas as pd
+from requests.adapters import HTTPAdapter
+
+FINMIND_URL = "https://api.finmindtrade.com/api/v4/data"
+MAX_WORKERS = 4
+TIMEOUT = 30
+RETRIES = 3
+RETRY_BACKOFF = 1.0
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# 'live' requests FinMind, 'record' also saves every response under RECORD_DIR and
+# 'replay' answers from the saved responses without network
+FETCH_MODE = 'live'
+RECORD_DIR = './Data/FinMind_Records/'
+RESPONSE_CACHE_SIZE = 64
+
+_session = None
+_session_lock = threading.Lock()
+_request_slots = None
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+_responses = OrderedDict()
+_responses_lock = threading.Lock()
 
 
 def create_folder(directory):
@@ -17,8 +44,183 @@ def check_dir(company_id, directory):
             create_folder(directory + str(company_id))
 
 
-def get_data_from_finmind(dataset, company_id, token, start_date, output_dir):
-    url = "https://api.finmindtrade.com/api/v4/data"
+def replace_file(path, write):
+    # Write to a temporary file next to path, then swap it in so readers never see a partial file
+    tmp_path = path + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class TokenBucket:
+    # Allows `rate` requests per second on average with bursts of up to `capacity`
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def get_session():
+    # One keep-alive connection pool shared by every download thread
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def get_request_slots():
+    # At most MAX_WORKERS FinMind requests in flight per process, whichever caller sends them
+    global _request_slots
+    with _session_lock:
+        if _request_slots is None:
+            _request_slots = threading.BoundedSemaphore(MAX_WORKERS)
+        return _request_slots
+
+
+def request_finmind(parameter, timeout=TIMEOUT, retries=RETRIES, limiter=None):
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            with get_request_slots():
+                resp = get_session().get(FINMIND_URL, params=parameter, timeout=timeout)
+                resp.raise_for_status()
+                return resp.json()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            status = getattr(e.response, 'status_code', None)
+            if attempt == retries or (status is not None and status not in RETRY_STATUS):
+                raise
+        time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+
+def get_request_key(parameter):
+    # The token does not change the response, so requests with different tokens are shared
+    return parameter['dataset'], str(parameter['data_id']), parameter['start_date']
+
+
+def get_cached_response(key):
+    with _responses_lock:
+        entry = _responses.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _responses[key]
+            return None
+        _responses.move_to_end(key)
+        return entry[1]
+
+
+def put_cached_response(key, response, ttl):
+    with _responses_lock:
+        _responses[key] = (time.monotonic() + ttl, response)
+        _responses.move_to_end(key)
+        while len(_responses) > RESPONSE_CACHE_SIZE:
+            _responses.popitem(last=False)
+
+
+def get_record_path(key):
+    dataset, data_id, start_date = key
+    return RECORD_DIR + dataset + '/' + data_id + '_' + start_date + '.json'
+
+
+def record_response(key, response):
+    path = get_record_path(key)
+    create_folder(os.path.dirname(path))
+
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='UTF-8') as file:
+            json.dump(response, file, ensure_ascii=False)
+
+    replace_file(path, write)
+
+
+def replay_response(key):
+    # The recording of the same start date, or else of the latest earlier start date with
+    # the rows before the requested one dropped, so rolling windows replay on later days
+    dataset, data_id, start_date = key
+    try:
+        names = os.listdir(RECORD_DIR + dataset)
+    except OSError:
+        names = []
+    prefix = data_id + '_'
+    start_dates = [name[len(prefix):-len('.json')] for name in names
+                   if name.startswith(prefix) and name.endswith('.json')]
+    start_dates = [recorded for recorded in start_dates if recorded <= start_date]
+    if not start_dates:
+        raise RuntimeError('No recorded response for ' + dataset + ' ' + data_id + ' from ' + start_date)
+
+    recorded = max(start_dates)
+    with open(get_record_path((dataset, data_id, recorded)), 'r', encoding='UTF-8') as file:
+        response = json.load(file)
+    if recorded != start_date:
+        response['data'] = [row for row in response.get('data', []) if str(row.get('date', '')) >= start_date]
+    return response
+
+
+def fetch_finmind(parameter, timeout=TIMEOUT, limiter=None, ttl=0):
+    # request_finmind behind a response cache kept for ttl seconds. Concurrent identical
+    # requests wait for the one in flight instead of downloading the same data again.
+    # Responses are shared between callers and must not be modified.
+    key = get_request_key(parameter)
+    if FETCH_MODE == 'replay':
+        return replay_response(key)
+
+    response = get_cached_response(key) if ttl else None
+    if response is not None:
+        return response
+
+    with _in_flight_lock:
+        flight = _in_flight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _in_flight[key] = Future()
+    if not leader:
+        return flight.result()
+
+    try:
+        response = request_finmind(parameter, timeout, limiter=limiter)
+        if ttl:
+            put_cached_response(key, response, ttl)
+        if FETCH_MODE == 'record':
+            record_response(key, response)
+    except BaseException as e:
+        flight.set_exception(e)
+        raise
+    else:
+        flight.set_result(response)
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+    return response
+
+
+def write_csv(data, output_dir):
+    replace_file(output_dir, lambda path: data.to_csv(path, index=False))
+
+
+def get_data_from_finmind(dataset, company_id, token, start_date, output_dir, timeout=TIMEOUT, limiter=None,
+                          ttl=0, **kwargs):
     parameter = {
         "dataset": dataset,
         "data_id": str(company_id),
@@ -26,24 +228,72 @@ def get_data_from_finmind(dataset, company_id, token, start_date, output_dir):
         "token": token,
     }
     try:
-        resp = requests.get(url, params=parameter)
-        data = resp.json()
+        data = fetch_finmind(parameter, timeout, limiter=limiter, ttl=ttl)
         data = pd.DataFrame(data["data"])
-        data.to_csv(output_dir, index=False)
-    except RuntimeError:
+        write_csv(data, output_dir)
+    except (RuntimeError, requests.RequestException, ValueError, KeyError):
         error = "Read " + dataset + " Failed"
     else:
         error = ""
     return error
 
 
-def get_stock_dict():
-    stock_table = pd.read_json('StockTable.json')
-    tw_dict = pd.Series(stock_table['公司簡稱'].values, stock_table['公司代號']).to_dict()
-    eng_dict = pd.Series(stock_table['英文簡稱'].values, stock_table['公司代號']).to_dict()
-    return tw_dict, eng_dict
+def sync_data_from_finmind(dataset, company_id, token, start_date, output_dir, timeout=TIMEOUT, key=('date',),
+                           overlap=False, limiter=None, ttl=0):
+    # Fetch only the rows after the last stored date and merge them into output_dir. Falls back
+    # to a full download when nothing is stored yet or the columns of the new rows changed.
+    # Rows before start_date are dropped, so datasets kept for a number of days stay that long.
+    try:
+        stored = pd.read_csv(output_dir)
+        last_date = pd.to_datetime(stored['date']).max()
+    except (OSError, ValueError, KeyError):
+        return get_data_from_finmind(dataset, company_id, token, start_date, output_dir, timeout, limiter, ttl)
+    if pd.isna(last_date):
+        return get_data_from_finmind(dataset, company_id, token, start_date, output_dir, timeout, limiter, ttl)
+
+    since = last_date if overlap else last_date + timedelta(days=1)
+    parameter = {
+        "dataset": dataset,
+        "data_id": str(company_id),
+        "start_date": max(since.date().isoformat(), start_date),
+        "token": token,
+    }
+    try:
+        data = pd.DataFrame(fetch_finmind(parameter, timeout, limiter=limiter, ttl=ttl)["data"])
+        if data.empty:
+            return ""
+        if set(data.columns) != set(stored.columns):
+            return get_data_from_finmind(dataset, company_id, token, start_date, output_dir, timeout, limiter, ttl)
 
+        data = pd.concat([stored, data[stored.columns]], ignore_index=True)
+        data = data.drop_duplicates(subset=list(key), keep='last')
+        data = data.sort_values(by=['date'], kind='mergesort')
+        data = data[(pd.to_datetime(data['date']) >= pd.Timestamp(start_date)).to_numpy()]
+        write_csv(data, output_dir)
+    except (RuntimeError, requests.RequestException, ValueError, KeyError):
+        return "Read " + dataset + " Failed"
+    return ""
 
 
+def get_datasets_from_finmind(downloads, token, max_workers=MAX_WORKERS, sync=False):
+    # downloads: keyword arguments of each dataset request, errors are returned in the same order
+    if not downloads:
+        return []
+    func = sync_data_from_finmind if sync else get_data_from_finmind
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(downloads))) as executor:
+        futures = [executor.submit(func, token=token, **download) for download in downloads]
+        return [future.result() for future in futures]
 
 
+def get_rss():
+    # Resident memory of this process in bytes, 0 when it cannot be read
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return 0
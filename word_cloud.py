@@ -0,0 +1,67 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+import plotly.graph_objs as go
+from wordcloud import WordCloud
+from utils import replace_file
+
+MEMORY_CACHE_SIZE = 64
+
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def get_word_cloud_key(frequencies, font_path, width, height):
+    items = sorted((str(word), round(float(value), 10)) for word, value in frequencies.items())
+    content = json.dumps([items, font_path, width, height], ensure_ascii=False)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def render_word_cloud(frequencies, font_path, width=800, height=400, cache_dir=None):
+    # PNG data URI of the word cloud, cached in memory and optionally as cache_dir/<key>.png
+    key = get_word_cloud_key(frequencies, font_path, width, height)
+
+    with _memory_lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            return _memory_cache[key]
+
+    path = cache_dir + key + '.png' if cache_dir else None
+    if path and os.path.exists(path):
+        with open(path, 'rb') as file:
+            png = file.read()
+    else:
+        word_cloud = WordCloud(background_color='white', font_path=font_path, width=width,
+                               height=height).generate_from_frequencies(frequencies=frequencies)
+        img = BytesIO()
+        word_cloud.to_image().save(img, format='PNG', optimize=True)
+        png = img.getvalue()
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+
+            def write(tmp_path):
+                with open(tmp_path, 'wb') as file:
+                    file.write(png)
+
+            replace_file(path, write)
+
+    source = 'data:image/png;base64,{}'.format(base64.b64encode(png).decode())
+    with _memory_lock:
+        _memory_cache[key] = source
+        while len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+    return source
+
+
+def get_word_cloud_figure(source, width=800, height=400):
+    fig = go.Figure()
+    fig.add_layout_image(dict(source=source, xref='x', yref='y', x=0, y=height,
+                              sizex=width, sizey=height, sizing='stretch', layer='below'))
+    fig.update_xaxes(range=[0, width], showgrid=False, zeroline=False)
+    fig.update_yaxes(range=[0, height], showgrid=False, zeroline=False, scaleanchor='x')
+    fig.update_layout(plot_bgcolor='rgba(0,0,0,0)')
+    return fig